@@ -1,14 +1,15 @@
 #!/usr/bin/env python3
 
-import json
+from case_store import open_store
+from error_analytics import score_cases, worst_cases
 
-# High-error cases from the evaluation
+# High-error cases from scoring the deployed model against public_cases.json
+scored = score_cases(open_store('public_cases.json'))
 high_error_cases = [
-    {"case": 996, "days": 1, "miles": 1082, "receipts": 1809.49, "expected": 446.94, "got": 1567.23, "error": 1120.29},
-    {"case": 684, "days": 8, "miles": 795, "receipts": 1645.99, "expected": 644.69, "got": 1502.25, "error": 857.56},
-    {"case": 548, "days": 8, "miles": 482, "receipts": 1411.49, "expected": 631.81, "got": 1488.82, "error": 857.01},
-    {"case": 520, "days": 14, "miles": 481, "receipts": 939.99, "expected": 877.17, "got": 1683.40, "error": 806.23},
-    {"case": 367, "days": 11, "miles": 740, "receipts": 1171.99, "expected": 902.09, "got": 1695.20, "error": 793.11}
+    {"case": int(i) + 1, "days": int(scored['days'][i]), "miles": scored['miles'][i],
+     "receipts": scored['receipts'][i], "expected": scored['expected'][i],
+     "got": scored['predicted'][i], "error": scored['error'][i]}
+    for i in worst_cases(scored, 5)
 ]
 
 print("🔍 Analysis of High-Error Cases:")
@@ -16,7 +17,7 @@ print("=" * 50)
 
 for case in high_error_cases:
     print(f"\nCase {case['case']}:")
-    print(f"  Trip: {case['days']} days, {case['miles']} miles, ${case['receipts']:.2f} receipts")
+    print(f"  Trip: {case['days']} days, {case['miles']:g} miles, ${case['receipts']:.2f} receipts")
     print(f"  Expected: ${case['expected']:.2f}")
     print(f"  Our result: ${case['got']:.2f}")
     print(f"  Error: ${case['error']:.2f}")
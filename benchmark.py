@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Performance benchmarks for the reimbursement model and its pipelines.
+
+Measures:
+  - cold start of ./run.sh (p50/p95/p99 over repeated invocations)
+  - in-process calls per second of the deployed model
+  - vectorized throughput (trips per second)
+  - end-to-end evaluate.py and generate_results.py pipelines
+
+Metrics are compared with a reference: per metric, the median of the last
+--reference (default 5) runs in benchmark_history.json that were not
+flagged. One slow or unusually fast run therefore cannot move the baseline.
+Any metric more than --threshold (default 10%) worse than the reference is
+flagged, and the exit status is 1 if so.
+
+A run is appended to the history with the commit it measured only when
+nothing was flagged, or when --accept is passed to record a deliberate
+change. An accepted run starts a new reference: older runs no longer count.
+
+Usage: python3 benchmark.py [--runs N] [--threshold PCT] [--reference N] [--history FILE]
+                            [--accept] [--no-save]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+HISTORY_PATH = os.path.join(HERE, 'benchmark_history.json')
+# Unflagged runs whose median is the reference
+REFERENCE_RUNS = 5
+
+# Metric name -> True when larger values are better
+HIGHER_IS_BETTER = {
+    'cold_start_p50_ms': False,
+    'cold_start_p95_ms': False,
+    'cold_start_p99_ms': False,
+    'calls_per_second': True,
+    'vectorized_trips_per_second': True,
+    'eval_public_ms': False,
+    'generate_private_ms': False,
+}
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of `samples`."""
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def bench_cold_start(runs):
+    run_sh = os.path.join(HERE, 'run.sh')
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([run_sh, '5', '250', '150.75'], check=True, stdout=subprocess.DEVNULL)
+        samples.append((time.perf_counter() - start) * 1000)
+    return {
+        'cold_start_p50_ms': percentile(samples, 50),
+        'cold_start_p95_ms': percentile(samples, 95),
+        'cold_start_p99_ms': percentile(samples, 99),
+    }
+
+
+def best_of(repeat, fn):
+    """Fastest of `repeat` timings of fn(), in seconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_in_process(cases):
+    from reimbursement import load_model
+
+    model = load_model()
+    inputs = [case[:3] for case in cases]
+
+    def run():
+        for days, miles, receipts in inputs:
+            model(days, miles, receipts)
+    return {'calls_per_second': len(inputs) / best_of(5, run)}
+
+
+def bench_vectorized(cases, size=1_000_000):
+    try:
+        import numpy as np
+        from vectorized import calculate_reimbursement_array
+    except ImportError:
+        return {}
+    columns = np.array([case[:3] for case in cases], dtype=np.float64)
+    columns = np.resize(columns, (size, 3))
+    days, miles, receipts = columns[:, 0].copy(), columns[:, 1].copy(), columns[:, 2].copy()
+    elapsed = best_of(3, lambda: calculate_reimbursement_array(days, miles, receipts))
+    return {'vectorized_trips_per_second': size / elapsed}
+
+
+def bench_pipelines(public_path, private_path):
+    from cases import load_cases, iter_cases
+    from evaluate import evaluate
+    from generate_results import generate
+    from reimbursement import load_model
+
+    def run_eval():
+        evaluate(load_cases(public_path), load_model())
+
+    def run_generate():
+        generate([case[:3] for case in iter_cases(private_path)])
+
+    return {
+        'eval_public_ms': best_of(3, run_eval) * 1000,
+        'generate_private_ms': best_of(3, run_generate) * 1000,
+    }
+
+
+def git_commit():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=HERE,
+                                capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def load_history(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+
+
+def reference(history, runs=REFERENCE_RUNS):
+    """(per-metric median over the last `runs` usable runs, those runs).
+
+    Usable runs flagged no regressions, and none is older than the latest
+    run saved with --accept.
+    """
+    start = max([i for i, entry in enumerate(history) if entry.get('accepted')], default=0)
+    usable = [entry for entry in history[start:] if not entry.get('regressions') or entry.get('accepted')][-runs:]
+    medians = {}
+    for name in HIGHER_IS_BETTER:
+        values = [entry['metrics'][name] for entry in usable if name in entry['metrics']]
+        if values:
+            medians[name] = statistics.median(values)
+    return medians, usable
+
+
+def regressions(baseline, current, threshold):
+    """[(metric, old, new, pct worse)] for metrics beyond `threshold` percent."""
+    flagged = []
+    for name, higher_is_better in HIGHER_IS_BETTER.items():
+        if name not in baseline or name not in current or not baseline[name]:
+            continue
+        change = (current[name] - baseline[name]) / baseline[name] * 100
+        worse = -change if higher_is_better else change
+        if worse > threshold:
+            flagged.append((name, baseline[name], current[name], worse))
+    return flagged
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=50, help="run.sh invocations for cold start")
+    parser.add_argument('--threshold', type=float, default=10.0, help="regression threshold in percent")
+    parser.add_argument('--public', default=os.path.join(HERE, 'public_cases.json'))
+    parser.add_argument('--private', default=os.path.join(HERE, 'private_cases.json'))
+    parser.add_argument('--reference', type=int, default=REFERENCE_RUNS,
+                        help="unflagged runs whose median is compared against")
+    parser.add_argument('--history', default=HISTORY_PATH)
+    parser.add_argument('--accept', action='store_true',
+                        help="save this run even if it flags regressions, making it part of the reference")
+    parser.add_argument('--no-save', action='store_true', help="do not append this run to the history")
+    args = parser.parse_args(argv)
+
+    from cases import load_cases
+    cases = load_cases(args.public)
+
+    metrics = {}
+    metrics.update(bench_cold_start(args.runs))
+    metrics.update(bench_in_process(cases))
+    metrics.update(bench_vectorized(cases))
+    metrics.update(bench_pipelines(args.public, args.private))
+
+    print("⏱️  Benchmark results:")
+    for name, value in metrics.items():
+        print(f"  {name:<30}{value:>16,.2f}")
+
+    history = load_history(args.history)
+    flagged = []
+    baseline, runs = reference(history, args.reference)
+    if runs:
+        flagged = regressions(baseline, metrics, args.threshold)
+        commits = ', '.join(entry.get('commit') or entry['timestamp'] for entry in runs)
+        print(f"\nCompared with the median of {len(runs)} run{'s' if len(runs) > 1 else ''} ({commits}):")
+        if flagged:
+            for name, old, new, worse in flagged:
+                print(f"  ❌ {name}: {old:,.2f} → {new:,.2f} ({worse:.1f}% worse)")
+        else:
+            print(f"  ✅ no regressions beyond {args.threshold:g}%")
+
+    if flagged and not args.accept and not args.no_save:
+        print("  Not saved to the history; rerun with --accept if the change is intended.")
+    elif not args.no_save:
+        entry = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'commit': git_commit(),
+            'metrics': metrics,
+        }
+        if flagged:
+            entry['regressions'] = [name for name, *_ in flagged]
+            entry['accepted'] = True
+        history.append(entry)
+        tmp_path = args.history + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(history, f, indent=2)
+        os.replace(tmp_path, args.history)
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
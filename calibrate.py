@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Search the breakpoints and rates in rules.json against public cases.
+
+Replaces the hand-picked tier configurations of tune_mileage.py and
+isolate_formula.py with a coordinate descent over every numeric rule. Cases
+are held in memory as arrays; a candidate only recomputes the component it
+changes (base, mileage, receipts or efficiency) before re-scoring. Several
+jittered starts run in parallel worker processes and the best rule set is
+written out in the rules.json layout, ready to deploy. Candidates are kept on
+the fixed_point.py grid (breakpoints in hundredths, rates and slopes in
+millionths), so fitted rules load on the integer-cents path unchanged.
+
+Usage: python3 calibrate.py [--starts N] [--workers N] [--passes N] [--output FILE]
+"""
+import argparse
+import copy
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from case_store import open_store
+from evaluate import array_metrics
+from fixed_point import INPUT_SCALE, RATE_SCALE
+from rules import DEFAULT_RULES, dump_rules, load_rules
+from vectorized import base_array, efficiency_array, mileage_array, receipts_array
+
+# Which model component each top-level rule group feeds
+COMPONENTS = {
+    'per_diem': 'base',
+    'five_day_bonus': 'base',
+    'mileage': 'mileage',
+    'receipts': 'receipts',
+    'efficiency': 'efficiency',
+}
+
+# Knobs that stay fixed: the trip length the bonus applies to
+FIXED = {('five_day_bonus', 'days')}
+
+
+def load_arrays(path='public_cases.json'):
+    return tuple(np.asarray(column, dtype=np.float64) for column in open_store(path))
+
+
+def knobs(rules, path=()):
+    """Yield the path of every tunable numeric leaf in `rules`."""
+    if isinstance(rules, dict):
+        # Only formula rules are searched, not correction stage settings
+        items = [(k, v) for k, v in rules.items() if path or k in COMPONENTS]
+    elif isinstance(rules, list):
+        items = enumerate(rules)
+    else:
+        if isinstance(rules, (int, float)) and path not in FIXED:
+            yield path
+        return
+    for key, value in items:
+        yield from knobs(value, path + (key,))
+
+
+def get_knob(rules, path):
+    for key in path:
+        rules = rules[key]
+    return rules
+
+
+def set_knob(rules, path, value):
+    for key in path[:-1]:
+        rules = rules[key]
+    rules[path[-1]] = value
+
+
+def is_breakpoint(path):
+    name = [key for key in path if isinstance(key, str)][-1]
+    return name == 'breaks' or name.startswith('min_') or name == 'receipt_threshold'
+
+
+def quantize(path, value):
+    """`value` rounded to the fixed-point precision of its knob; ints unchanged."""
+    if isinstance(value, int):
+        return value
+    scale = INPUT_SCALE if is_breakpoint(path) else RATE_SCALE
+    return round(round(value * scale) / scale, len(str(scale)) - 1)
+
+
+def initial_step(path, value):
+    if is_breakpoint(path):
+        return max(abs(value) * 0.1, 1.0)
+    return max(abs(value) * 0.1, 0.001)
+
+
+def valid(rules, path):
+    if 'breaks' in path:
+        breaks = get_knob(rules, path[:-1])
+        return breaks[0] > 0 and all(a < b for a, b in zip(breaks, breaks[1:]))
+    return True
+
+
+class Scorer:
+    """Scores candidate rule sets, recomputing only the changed component."""
+
+    def __init__(self, days, miles, receipts, expected, rules):
+        self.days = days
+        self.miles = miles
+        self.receipts = receipts
+        self.expected = expected
+        self.evaluations = 0
+        self.components = {name: self.component(name, rules) for name in set(COMPONENTS.values())}
+
+    def component(self, name, rules):
+        if name == 'base':
+            return base_array(self.days, rules)
+        if name == 'mileage':
+            return mileage_array(self.miles, rules)
+        if name == 'receipts':
+            return receipts_array(self.receipts, rules)
+        return efficiency_array(self.days, self.miles, self.receipts, rules)
+
+    def score_with(self, name, array):
+        parts = dict(self.components, **{name: array})
+        self.evaluations += 1
+        predicted = (parts['base'] + parts['mileage'] + parts['receipts']) * parts['efficiency']
+        return array_metrics(predicted, self.expected)['score']
+
+    def current(self):
+        name = 'base'
+        return self.score_with(name, self.components[name])
+
+
+def coordinate_descent(scorer, rules, passes=20, width=4, min_scale=1e-3):
+    """Refine every knob in turn over a grid of +/- `width` steps.
+
+    Steps halve after a pass without improvement; stops after `passes`
+    passes or once steps fall below `min_scale` of their initial size.
+    """
+    rules = copy.deepcopy(rules)
+    paths = list(knobs(rules))
+    for path in paths:
+        set_knob(rules, path, quantize(path, get_knob(rules, path)))
+    scorer.components = {name: scorer.component(name, rules) for name in scorer.components}
+    steps = {path: initial_step(path, get_knob(rules, path)) for path in paths}
+    best = scorer.current()
+    scale = 1.0
+
+    for _ in range(passes):
+        improved = False
+        for path in paths:
+            name = COMPONENTS[path[0]]
+            value = get_knob(rules, path)
+            step = steps[path] * scale
+            for k in range(-width, width + 1):
+                if k == 0:
+                    continue
+                candidate = value + k * step
+                if isinstance(value, int) and 'breaks' in path:
+                    candidate = int(round(candidate))
+                candidate = quantize(path, candidate)
+                if candidate == value:
+                    continue
+                set_knob(rules, path, candidate)
+                if valid(rules, path):
+                    array = scorer.component(name, rules)
+                    result = scorer.score_with(name, array)
+                    if result < best - 1e-9:
+                        best = result
+                        value = candidate
+                        scorer.components[name] = array
+                        improved = True
+                set_knob(rules, path, value)
+        if not improved:
+            scale /= 2
+            if scale < min_scale:
+                break
+    return best, rules
+
+
+def jitter(rules, rng, amount=0.1):
+    rules = copy.deepcopy(rules)
+    for path in knobs(rules):
+        value = get_knob(rules, path)
+        candidate = value * (1 + rng.uniform(-amount, amount))
+        if isinstance(value, int):
+            candidate = int(round(candidate))
+        set_knob(rules, path, quantize(path, candidate))
+        if not valid(rules, path):
+            set_knob(rules, path, value)
+    return rules
+
+
+_arrays = None
+
+
+def _init_worker(path):
+    global _arrays
+    _arrays = load_arrays(path)
+
+
+def run_start(seed, rules, passes):
+    """One descent from `rules` (jittered unless seed is 0)."""
+    start_rules = rules if seed == 0 else jitter(rules, np.random.default_rng(seed))
+    scorer = Scorer(*_arrays, start_rules)
+    best, fitted = coordinate_descent(scorer, start_rules, passes=passes)
+    return best, fitted, scorer.evaluations
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--rules', default=None, help="rule file to start from (default: rules.json)")
+    parser.add_argument('--starts', type=int, default=None, help="descent starts (default: worker count)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--passes', type=int, default=20)
+    parser.add_argument('--output', default=None, help="write the best rule set here instead of stdout")
+    args = parser.parse_args(argv)
+
+    rules = load_rules(args.rules) if args.rules else DEFAULT_RULES
+
+    workers = args.workers or os.cpu_count() or 1
+    starts = args.starts or workers
+
+    _init_worker(args.cases)
+    initial = Scorer(*_arrays, rules).current()
+    print(f"Starting score: {initial:.2f} over {len(_arrays[3])} cases", file=sys.stderr)
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(args.cases,)) as pool:
+        results = list(pool.map(run_start, range(starts), [rules] * starts, [args.passes] * starts))
+    elapsed = time.perf_counter() - start
+
+    evaluations = sum(r[2] for r in results)
+    for seed, (result, _, count) in enumerate(results):
+        print(f"  start {seed}: score {result:.2f} ({count} candidates)", file=sys.stderr)
+    best, fitted, _ = min(results, key=lambda r: r[0])
+    print(f"Best score: {best:.2f} ({evaluations} candidates in {elapsed:.1f}s, "
+          f"{evaluations / elapsed:.0f}/s)", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            dump_rules(fitted, f)
+    else:
+        dump_rules(fitted, sys.stdout)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
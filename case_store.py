@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""Columnar binary store for case files, read through np.memmap.
+
+`<source>.cols` holds days, miles, receipts and (for public cases) expected
+output as contiguous little-endian arrays after a small JSON header. Days
+are stored as int16 and miles as int32 when every value is integral, and
+fall back to float64 otherwise (some archives carry fractional miles).
+Loading maps the columns without copying or parsing anything.
+
+The header records the source's mtime, size and SHA-256. open_store()
+trusts a store whose mtime and size still match, re-hashes the source
+otherwise, and rebuilds the store whenever the content has changed. A
+source that was only touched gets its new mtime recorded, so it is hashed
+once rather than on every open.
+
+Usage: python3 case_store.py <cases.json> [...]   (build or refresh stores)
+"""
+import hashlib
+import json
+import os
+import shutil
+import struct
+import sys
+from array import array
+from collections import namedtuple
+
+import numpy as np
+
+from cases import iter_cases
+
+MAGIC = b'CASECOL1'
+PREFIX = struct.Struct('<8sI')  # magic, header length
+ALIGN = 64
+
+CaseColumns = namedtuple('CaseColumns', 'days miles receipts expected')
+
+
+def store_path(source):
+    return source + '.cols'
+
+
+def source_fingerprint(source):
+    st = os.stat(source)
+    return {'mtime_ns': st.st_mtime_ns, 'size': st.st_size}
+
+
+def source_hash(source):
+    digest = hashlib.sha256()
+    with open(source, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _narrowest(values, int_dtype):
+    info = np.iinfo(int_dtype)
+    if values.size and (np.any(values != np.round(values))
+                        or values.min() < info.min or values.max() > info.max):
+        return values
+    return values.astype(int_dtype)
+
+
+def build_store(source, path=None):
+    """Convert `source` to a columnar store; returns the store path."""
+    path = path or store_path(source)
+    fingerprint = source_fingerprint(source)
+
+    # Accumulate into flat float64 buffers rather than a list of records
+    raw = {name: array('d') for name in CaseColumns._fields}
+    has_expected = None
+    for case in iter_cases(source):
+        if has_expected is None:
+            has_expected = case.expected is not None
+        raw['days'].append(case.days)
+        raw['miles'].append(case.miles)
+        raw['receipts'].append(case.receipts)
+        if has_expected:
+            raw['expected'].append(case.expected)
+    count = len(raw['days'])
+
+    columns = {
+        'days': _narrowest(np.frombuffer(raw['days']), np.int16),
+        'miles': _narrowest(np.frombuffer(raw['miles']), np.int32),
+        'receipts': np.frombuffer(raw['receipts']),
+    }
+    if has_expected:
+        columns['expected'] = np.frombuffer(raw['expected'])
+
+    layout = {}
+    offset = 0
+    for name, values in columns.items():
+        layout[name] = {'dtype': values.dtype.newbyteorder('<').str, 'offset': offset}
+        offset += -(-values.nbytes // ALIGN) * ALIGN
+    header = {
+        'count': count,
+        'source': dict(fingerprint, sha256=source_hash(source)),
+        'columns': layout,
+    }
+
+    def write_columns(f, data_start):
+        for name, values in columns.items():
+            f.seek(data_start + layout[name]['offset'])
+            f.write(values.astype(layout[name]['dtype'], copy=False).tobytes())
+
+    write_store(path, header, offset, write_columns)
+    return path
+
+
+def write_store(path, header, data_size, write_columns):
+    """Atomically write a store: `header`, then write_columns(f, data_start)."""
+    encoded = json.dumps(header).encode()
+    data_start = -(-(PREFIX.size + len(encoded)) // ALIGN) * ALIGN
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, len(encoded)))
+        f.write(encoded)
+        write_columns(f, data_start)
+        f.truncate(data_start + data_size)
+    os.replace(tmp_path, path)
+
+
+def refresh_fingerprint(path, header, fingerprint):
+    """Rewrite the store at `path` recording `fingerprint`, columns unchanged."""
+    updated = {key: header[key] for key in ('count', 'source', 'columns')}
+    updated['source'] = dict(header['source'], **fingerprint)
+    data_size = os.path.getsize(path) - header['data_start']
+
+    def copy_columns(f, data_start):
+        with open(path, 'rb') as old:
+            old.seek(header['data_start'])
+            f.seek(data_start)
+            shutil.copyfileobj(old, f)
+
+    write_store(path, updated, data_size, copy_columns)
+
+
+def read_header(path):
+    with open(path, 'rb') as f:
+        magic, length = PREFIX.unpack(f.read(PREFIX.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a case store")
+        header = json.loads(f.read(length))
+    header['data_start'] = -(-(PREFIX.size + length) // ALIGN) * ALIGN
+    return header
+
+
+def is_current(source, path, header):
+    recorded = header['source']
+    fingerprint = source_fingerprint(source)
+    if fingerprint['mtime_ns'] == recorded['mtime_ns'] and fingerprint['size'] == recorded['size']:
+        return True
+    # Touched but possibly unchanged: fall back to the content hash
+    if fingerprint['size'] != recorded['size'] or source_hash(source) != recorded['sha256']:
+        return False
+    try:
+        refresh_fingerprint(path, header, fingerprint)
+    except OSError:
+        pass  # a read-only store still serves; it is just re-hashed next time
+    return True
+
+
+def map_columns(path, header):
+    count = header['count']
+    columns = {}
+    for name, spec in header['columns'].items():
+        if count == 0:  # np.memmap cannot map an empty region
+            columns[name] = np.empty(0, dtype=spec['dtype'])
+            continue
+        columns[name] = np.memmap(path, dtype=np.dtype(spec['dtype']), mode='r',
+                                  offset=header['data_start'] + spec['offset'], shape=(count,))
+    return CaseColumns(columns['days'], columns['miles'], columns['receipts'],
+                       columns.get('expected'))
+
+
+def open_store(source):
+    """Memory-mapped CaseColumns for `source`, (re)building the store if needed."""
+    path = store_path(source)
+    try:
+        header = read_header(path)
+        current = is_current(source, path, header)
+    except (OSError, ValueError, KeyError):
+        current = False
+    if not current:
+        build_store(source, path)
+    # Re-read even when current: refreshing the fingerprint may move the columns
+    header = read_header(path)
+    return map_columns(path, header)
+
+
+def main(argv):
+    if not argv:
+        sys.exit("Usage: case_store.py <cases.json> [...]")
+    for source in argv:
+        columns = open_store(source)
+        dtypes = ', '.join(f"{name} {getattr(columns, name).dtype}"
+                           for name in CaseColumns._fields if getattr(columns, name) is not None)
+        print(f"{store_path(source)}: {len(columns.days)} cases ({dtypes})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,78 @@
+"""Streaming reader for case files.
+
+Reads public_cases.json (`input` / `expected_output` records),
+private_cases.json (flat records) or a JSON-lines archive of either
+layout, one record at a time. Only the current chunk of the file is held in
+memory, so archives of millions of claims can be scanned in bounded space.
+"""
+import json
+from collections import namedtuple
+
+# expected is None for cases without a known output (private layout)
+Case = namedtuple('Case', 'days miles receipts expected')
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = ' \t\r\n'
+
+
+def iter_records(f, chunk_size=CHUNK_SIZE):
+    """Yield the top-level objects of a JSON array or JSON-lines stream."""
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+    in_array = None  # unknown until the first non-blank character
+
+    while True:
+        while pos < len(buf) and (buf[pos] in WHITESPACE or (in_array and buf[pos] == ',')):
+            pos += 1
+        if pos == len(buf):
+            if eof:
+                if in_array:
+                    raise ValueError("unexpected end of case file")
+                return
+            buf = f.read(chunk_size)
+            pos = 0
+            eof = not buf
+            continue
+
+        if in_array is None:
+            in_array = buf[pos] == '['
+            if in_array:
+                pos += 1
+            continue
+        if in_array and buf[pos] == ']':
+            return
+
+        try:
+            record, end = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The record straddles the chunk boundary; keep only its start
+            chunk = f.read(chunk_size)
+            buf = buf[pos:] + chunk
+            pos = 0
+            eof = not chunk
+            continue
+        yield record
+        pos = end
+
+
+def to_case(record):
+    fields = record.get('input', record)
+    return Case(fields['trip_duration_days'],
+                fields['miles_traveled'],
+                fields['total_receipts_amount'],
+                record.get('expected_output'))
+
+
+def iter_cases(path, chunk_size=CHUNK_SIZE):
+    """Yield a Case per record of the case file at `path`."""
+    with open(path, 'r') as f:
+        for record in iter_records(f, chunk_size):
+            yield to_case(record)
+
+
+def load_cases(path):
+    return list(iter_cases(path))
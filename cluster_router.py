@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""Route trips to trip-profile clusters, each with its own correction rates.
+
+The interviews describe separate calculation paths by trip shape (one-day
+sprints, long low-spend trips, the 5-day sweet spot). Instead of hand-ordered
+branches, `build` runs k-means over (days, miles per day, receipts per day),
+each feature standardized, on public_cases.json. For every cluster it then
+fits by least squares a set of rates for the formula's residual:
+
+    correction = base + per_day x days + per_mile x miles
+                 + per_receipt x receipts + formula x amount
+
+Routing is a nearest-centroid search over k points in three dimensions. It
+is a plain loop for single calls (run.sh) and one NumPy argmin for arrays.
+Centroids and rates go to clusters.json along with the formula rules
+digest, and loading refuses an index built for different rules.
+
+Enable it in rules.json with a correction entry such as
+    {"stage": "clusters"}
+
+Usage: python3 cluster_router.py build [--cases FILE] [--k N] [--restarts N] [--seed N] [--holdout F]
+"""
+import json
+import os
+import sys
+
+from rules import DEFAULT_RULES, rules_digest
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clusters.json')
+
+FEATURES = ('days', 'miles_per_day', 'receipts_per_day')
+RATES = ('base', 'per_day', 'per_mile', 'per_receipt', 'formula')
+DEFAULT_K = 8
+# Ridge on the per-cluster normal equations, relative to each diagonal entry
+RIDGE = 1e-8
+
+
+class ClusterRouter:
+    """Standardization, centroids (standardized units) and RATES per cluster."""
+
+    def __init__(self, mean, scale, centroids, rates):
+        self.mean = tuple(mean)
+        self.scale = tuple(scale)
+        self.centroids = [tuple(c) for c in centroids]
+        self.rates = [tuple(r) for r in rates]
+
+    def features(self, days, miles, receipts):
+        per = days if days > 0 else 1.0
+        m0, m1, m2 = self.mean
+        s0, s1, s2 = self.scale
+        return ((days - m0) / s0, (miles / per - m1) / s1, (receipts / per - m2) / s2)
+
+    def route(self, days, miles, receipts):
+        """Index of the nearest centroid."""
+        z0, z1, z2 = self.features(days, miles, receipts)
+        best = 0
+        best_d2 = float('inf')
+        for j, (c0, c1, c2) in enumerate(self.centroids):
+            d2 = (z0 - c0) ** 2 + (z1 - c1) ** 2 + (z2 - c2) ** 2
+            if d2 < best_d2:
+                best, best_d2 = j, d2
+        return best
+
+    def correction(self, days, miles, receipts, amount):
+        base, per_day, per_mile, per_receipt, formula = self.rates[self.route(days, miles, receipts)]
+        return base + per_day * days + per_mile * miles + per_receipt * receipts + formula * amount
+
+    def feature_array(self, days, miles, receipts):
+        import numpy as np
+
+        days = np.asarray(days, dtype=np.float64)
+        per = np.where(days > 0, days, 1.0)
+        raw = (days, np.asarray(miles, dtype=np.float64) / per, np.asarray(receipts, dtype=np.float64) / per)
+        return np.column_stack([(x - m) / s for x, m, s in zip(raw, self.mean, self.scale)])
+
+    def route_array(self, days, miles, receipts):
+        """Nearest-centroid index per trip; same arithmetic as route()."""
+        import numpy as np
+
+        return nearest(self.feature_array(days, miles, receipts), np.array(self.centroids))
+
+    def correction_array(self, days, miles, receipts, amounts):
+        """correction() per trip, term by term in the same order."""
+        import numpy as np
+
+        base, per_day, per_mile, per_receipt, formula = np.array(self.rates)[
+            self.route_array(days, miles, receipts)].T
+        return base + per_day * days + per_mile * miles + per_receipt * receipts + formula * amounts
+
+    def to_json(self, digest):
+        return {
+            'digest': digest,
+            'features': list(FEATURES),
+            'mean': list(self.mean),
+            'scale': list(self.scale),
+            'centroids': [list(c) for c in self.centroids],
+            'rates': [dict(zip(RATES, r)) for r in self.rates],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data['mean'], data['scale'], data['centroids'],
+                   [[r[name] for name in RATES] for r in data['rates']])
+
+
+def nearest(Z, centroids):
+    """Row-wise argmin of squared distance from Z (n x 3) to centroids (k x 3)."""
+    diff = Z[:, None, :] - centroids[None, :, :]
+    d2 = diff[:, :, 0] ** 2 + diff[:, :, 1] ** 2 + diff[:, :, 2] ** 2
+    return d2.argmin(axis=1)
+
+
+def design_matrix(days, miles, receipts, amounts):
+    import numpy as np
+
+    days = np.asarray(days, dtype=np.float64)
+    return np.column_stack([np.ones_like(days), days, miles, receipts, amounts])
+
+
+def kmeans(Z, k, rng, iterations=100, restarts=8):
+    """Best of `restarts` k-means++ seeded Lloyd runs; returns (centroids, labels, inertia)."""
+    import numpy as np
+
+    best = None
+    for _ in range(restarts):
+        centroids = Z[[rng.integers(len(Z))]]
+        for _ in range(1, k):
+            d2 = ((Z[:, None, :] - centroids[None]) ** 2).sum(axis=2).min(axis=1)
+            centroids = np.vstack([centroids, Z[rng.choice(len(Z), p=d2 / d2.sum())]])
+        labels = None
+        for _ in range(iterations):
+            new = nearest(Z, centroids)
+            if labels is not None and np.array_equal(new, labels):
+                break
+            labels = new
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, Z)
+            counts = np.bincount(labels, minlength=k)
+            empty = counts == 0
+            centroids = np.where(empty[:, None], centroids, sums / np.maximum(counts, 1)[:, None])
+            if empty.any():
+                # Reseed empty clusters at the worst-fitted points
+                d2 = ((Z - centroids[labels]) ** 2).sum(axis=1)
+                centroids[empty] = Z[np.argsort(d2)[::-1][:empty.sum()]]
+        inertia = float(((Z - centroids[labels]) ** 2).sum())
+        if best is None or inertia < best[2]:
+            best = (centroids, labels, inertia)
+    return best
+
+
+def fit_router(days, miles, receipts, expected, amounts, k=DEFAULT_K, seed=0, restarts=8):
+    """Cluster the trips and fit RATES per cluster to expected - amounts."""
+    import numpy as np
+
+    days = np.asarray(days, dtype=np.float64)
+    per = np.where(days > 0, days, 1.0)
+    raw = np.column_stack([days, np.asarray(miles) / per, np.asarray(receipts) / per])
+    mean = raw.mean(axis=0)
+    scale = np.where(raw.std(axis=0) > 0, raw.std(axis=0), 1.0)
+    centroids, labels, _ = kmeans((raw - mean) / scale, k, np.random.default_rng(seed), restarts=restarts)
+
+    X = design_matrix(days, miles, receipts, amounts)
+    residual = np.asarray(expected, dtype=np.float64) - np.asarray(amounts, dtype=np.float64)
+    rates = []
+    for j in range(k):
+        rows = labels == j
+        gram = X[rows].T @ X[rows]
+        rates.append(np.linalg.solve(gram + RIDGE * np.diag(np.diag(gram) + 1.0), X[rows].T @ residual[rows]))
+    return ClusterRouter(mean.tolist(), scale.tolist(), centroids.tolist(), np.array(rates).tolist())
+
+
+def save_router(router, path=INDEX_PATH, rules=DEFAULT_RULES):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(router.to_json(rules_digest(rules)), f, indent=1)
+    os.replace(tmp_path, path)
+
+
+def load_router(path=INDEX_PATH, rules=DEFAULT_RULES):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data['digest'] != rules_digest(rules):
+        raise ValueError(f"{path} was built for different rules; rebuild with cluster_router.py build")
+    return ClusterRouter.from_json(data)
+
+
+def make_stage(config, rules=DEFAULT_RULES):
+    """Correction stage for reimbursement.load_model under raw `rules`."""
+    router = load_router(config.get('index', INDEX_PATH), rules)
+
+    def stage(days, miles, receipts, amount):
+        return amount + router.correction(days, miles, receipts, amount)
+    return stage
+
+
+def make_array_stage(config, rules=DEFAULT_RULES):
+    """Batch form of make_stage for service.py: amounts arrays in, corrected arrays out."""
+    router = load_router(config.get('index', INDEX_PATH), rules)
+
+    def stage(days, miles, receipts, amounts):
+        return amounts + router.correction_array(days, miles, receipts, amounts)
+    return stage
+
+
+def mean_error(predicted, expected):
+    import numpy as np
+
+    return float(np.abs(np.round(predicted, 2) - expected).mean())
+
+
+def main(argv):
+    import argparse
+    import time
+
+    import numpy as np
+
+    from case_store import open_store
+    from vectorized import calculate_reimbursement_array
+
+    parser = argparse.ArgumentParser(description="Build the trip-profile cluster router.")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--restarts', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--holdout', type=float, default=0.2,
+                        help="fraction held out to report generalization before the final fit")
+    parser.add_argument('--output', default=INDEX_PATH)
+    args = parser.parse_args(argv)
+
+    columns = open_store(args.cases)
+    days, miles, receipts, expected = (np.asarray(c, dtype=np.float64) for c in columns)
+    amounts = calculate_reimbursement_array(days, miles, receipts)
+
+    if args.holdout > 0:
+        held = np.random.default_rng(args.seed).random(len(days)) < args.holdout
+        router = fit_router(days[~held], miles[~held], receipts[~held], expected[~held], amounts[~held],
+                            args.k, args.seed, args.restarts)
+        corrected = amounts[held] + router.correction_array(days[held], miles[held], receipts[held],
+                                                            amounts[held])
+        print(f"Holdout ({held.sum()} cases) average error: ${mean_error(amounts[held], expected[held]):.2f}"
+              f" → ${mean_error(corrected, expected[held]):.2f}")
+
+    start = time.perf_counter()
+    router = fit_router(days, miles, receipts, expected, amounts, args.k, args.seed, args.restarts)
+    elapsed = time.perf_counter() - start
+    save_router(router, args.output)
+    corrected = amounts + router.correction_array(days, miles, receipts, amounts)
+    print(f"Wrote {args.output}: {args.k} clusters fitted in {elapsed:.2f}s; training average error "
+          f"${mean_error(amounts, expected):.2f} → ${mean_error(corrected, expected):.2f}")
+
+    labels = router.route_array(days, miles, receipts)
+    print(f"  {'cluster':<9}{'cases':>6}{'days':>7}{'mi/day':>9}{'$/day':>9}  "
+          + ''.join(f"{name:>12}" for name in RATES))
+    for j, (centroid, rates) in enumerate(zip(router.centroids, router.rates)):
+        profile = [c * s + m for c, s, m in zip(centroid, router.scale, router.mean)]
+        print(f"  {j:<9}{np.count_nonzero(labels == j):>6}{profile[0]:>7.1f}{profile[1]:>9.1f}{profile[2]:>9.1f}  "
+              + ''.join(f"{r:>12.4f}" for r in rates))
+
+    # Single-call and batch routing must agree
+    start = time.perf_counter()
+    scalar = [router.route(d, m, r) for d, m, r in zip(days.tolist(), miles.tolist(), receipts.tolist())]
+    scalar_time = time.perf_counter() - start
+    start = time.perf_counter()
+    batch = router.route_array(days, miles, receipts)
+    batch_time = time.perf_counter() - start
+    mismatches = int(np.count_nonzero(np.array(scalar) != batch))
+    print(f"Routing {len(days)} trips: {scalar_time / len(days) * 1e6:.1f} µs per single call, "
+          f"{batch_time * 1000:.2f} ms as one batch, {mismatches} disagreements")
+    if mismatches:
+        sys.exit("Scalar and batch routing disagree")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
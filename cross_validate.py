@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""Parallel k-fold cross-validation of model-fitting routines.
+
+Splits the public cases into k folds, stratified by trip length and receipt
+band, fits a model on each fold's complement in its own worker process and
+scores it on the held-out fold. The out-of-fold error is the estimate of how
+the fitted model will do on private_cases.json; the gap to the in-fold
+(training) error shows how much of a fit is overfitting.
+
+The case columns and fold assignment are written once into a shared memory
+block that workers map at start-up, so each task only carries a fold number
+and the fitter name.
+
+A fitter is fit(days, miles, receipts, expected, **options) -> predict, where
+predict(days, miles, receipts) returns an array of amounts. Built in:
+  formula   rules.json as is (no fitting; the baseline)
+  rates     calibrate.py coordinate descent over every rule
+  trees     train_trees.py gradient boosting
+  knn       formula plus knn_correction.py residuals of the training cases
+  hinge     hinge_fit.py least squares (hinge.search=1 to move breakpoints)
+  clusters  formula plus cluster_router.py per-cluster residual rates
+Any other `module:function` with that signature works too.
+
+Usage: python3 cross_validate.py [FITTER ...] [--folds K] [--workers N] [--seed N]
+                                 [--option fitter.key=value ...]
+"""
+import argparse
+import importlib
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from case_store import open_store
+from evaluate import array_metrics
+from rules import DEFAULT_RULES
+from vectorized import calculate_reimbursement_array
+
+COLUMNS = ('days', 'miles', 'receipts', 'expected', 'fold')
+
+
+def fit_formula(days, miles, receipts, expected, rules=DEFAULT_RULES):
+    return lambda d, m, r: calculate_reimbursement_array(d, m, r, rules)
+
+
+def fit_rates(days, miles, receipts, expected, rules=DEFAULT_RULES, passes=5):
+    from calibrate import Scorer, coordinate_descent
+
+    _, fitted = coordinate_descent(Scorer(days, miles, receipts, expected, rules), rules, passes=int(passes))
+    return fit_formula(days, miles, receipts, expected, fitted)
+
+
+def fit_trees(days, miles, receipts, expected, trees=200, depth=4, min_leaf=5, learning_rate=0.1):
+    from train_trees import feature_matrix, fit_ensemble, predict_ensemble
+
+    base, ensemble = fit_ensemble(feature_matrix(days, miles, receipts), expected, trees=int(trees),
+                                  depth=int(depth), min_leaf=int(min_leaf), learning_rate=float(learning_rate))
+    return lambda d, m, r: predict_ensemble(base, ensemble, feature_matrix(d, m, r))
+
+
+def fit_knn(days, miles, receipts, expected, k=5):
+    from knn_correction import build_index
+    from reimbursement import calculate_reimbursement
+
+    cases = list(zip(days.tolist(), miles.tolist(), receipts.tolist(), expected.tolist()))
+    index = build_index(cases, calculate_reimbursement, int(k))
+
+    def predict(d, m, r):
+        return np.array([calculate_reimbursement(*trip) + index.correction(*trip)
+                         for trip in zip(d.tolist(), m.tolist(), r.tolist())])
+    return predict
+
+
+def fit_hinge(days, miles, receipts, expected, **options):
+    from hinge_fit import fit_hinge
+
+    return fit_hinge(days, miles, receipts, expected, **options)
+
+
+def fit_clusters(days, miles, receipts, expected, k=8, restarts=8, seed=0):
+    from cluster_router import fit_router
+
+    amounts = calculate_reimbursement_array(days, miles, receipts)
+    router = fit_router(days, miles, receipts, expected, amounts, int(k), int(seed), int(restarts))
+
+    def predict(d, m, r):
+        formula = calculate_reimbursement_array(d, m, r)
+        return formula + router.correction_array(d, m, r, formula)
+    return predict
+
+
+FITTERS = {
+    'formula': fit_formula,
+    'rates': fit_rates,
+    'trees': fit_trees,
+    'knn': fit_knn,
+    'hinge': fit_hinge,
+    'clusters': fit_clusters,
+}
+
+
+def resolve_fitter(name):
+    if name in FITTERS:
+        return FITTERS[name]
+    module, _, function = name.partition(':')
+    if not function:
+        raise ValueError(f"Unknown fitter {name!r}; use one of {', '.join(FITTERS)} or module:function")
+    return getattr(importlib.import_module(module), function)
+
+
+def assign_folds(days, receipts, k, rng, rules=DEFAULT_RULES):
+    """Fold number per case, dealt round-robin within each (days, receipt band) stratum."""
+    band = np.searchsorted(rules['receipts']['breaks'], receipts, side='right')
+    strata = np.unique(np.column_stack([days, band]), axis=0, return_inverse=True)[1].reshape(-1)
+    folds = np.empty(len(days), dtype=np.int64)
+    # One running counter across strata so small strata do not all start at fold 0
+    dealt = 0
+    for stratum in range(strata.max() + 1):
+        members = rng.permutation(np.flatnonzero(strata == stratum))
+        folds[members] = (dealt + np.arange(len(members))) % k
+        dealt += len(members)
+    return folds
+
+
+def error_metrics(predicted, expected):
+    metrics = array_metrics(predicted, expected)
+    return {
+        'avg_error': metrics['avg_error'],
+        'exact': metrics['exact_matches'],
+        'close': metrics['close_matches'],
+        'score': metrics['score'],
+    }
+
+
+_shared = None
+_columns = None
+
+
+def _attach(name, count):
+    global _shared, _columns
+    _shared = shared_memory.SharedMemory(name=name)
+    table = np.ndarray((len(COLUMNS), count), dtype=np.float64, buffer=_shared.buf)
+    _columns = dict(zip(COLUMNS, table))
+
+
+def run_fold(fitter_name, fold, options):
+    """Fit on every fold but `fold`; return (held-out rows, predictions, training metrics, seconds)."""
+    held = _columns['fold'] == fold
+    train = {name: np.array(values[~held]) for name, values in _columns.items()}
+    start = time.perf_counter()
+    predict = resolve_fitter(fitter_name)(train['days'], train['miles'], train['receipts'], train['expected'],
+                                          **options)
+    elapsed = time.perf_counter() - start
+    training = error_metrics(predict(train['days'], train['miles'], train['receipts']), train['expected'])
+    rows = np.flatnonzero(held)
+    predicted = predict(_columns['days'][rows], _columns['miles'][rows], _columns['receipts'][rows])
+    return rows, np.asarray(predicted, dtype=np.float64), training, elapsed
+
+
+def cross_validate(fitter_names, columns, k=5, workers=None, seed=0, options=None):
+    """{fitter: {'folds': [...], 'train': metrics, 'out_of_fold': metrics}} for each fitter.
+
+    `options` maps fitter name -> keyword arguments for that fitter.
+    """
+    days = np.asarray(columns.days, dtype=np.float64)
+    count = len(days)
+    folds = assign_folds(days, np.asarray(columns.receipts, dtype=np.float64), k, np.random.default_rng(seed))
+
+    shared = shared_memory.SharedMemory(create=True, size=len(COLUMNS) * count * 8)
+    table = None
+    try:
+        table = np.ndarray((len(COLUMNS), count), dtype=np.float64, buffer=shared.buf)
+        for row, values in zip(table, (days, columns.miles, columns.receipts, columns.expected, folds)):
+            row[:] = values
+        expected = table[3].copy()
+
+        tasks = [(name, fold) for name in fitter_names for fold in range(k)]
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach, initargs=(shared.name, count)) as pool:
+            futures = [pool.submit(run_fold, name, fold, (options or {}).get(name, {})) for name, fold in tasks]
+            outcomes = [future.result() for future in futures]
+    finally:
+        table = None  # release the view before closing the block
+        shared.close()
+        shared.unlink()
+
+    report = {}
+    for (name, fold), (rows, predicted, training, elapsed) in zip(tasks, outcomes):
+        entry = report.setdefault(name, {'folds': [], 'predicted': np.zeros(count)})
+        entry['predicted'][rows] = predicted
+        held_out = error_metrics(predicted, expected[rows])
+        entry['folds'].append({'fold': fold, 'cases': len(rows), 'fit_seconds': elapsed,
+                               'train': training, 'test': held_out})
+    for entry in report.values():
+        entry['out_of_fold'] = error_metrics(entry.pop('predicted'), expected)
+        entry['train'] = {key: float(np.mean([f['train'][key] for f in entry['folds']]))
+                          for key in ('avg_error', 'score')}
+    return report
+
+
+def parse_option(text):
+    """`fitter.key=value` -> (fitter, key, value), with numeric values as floats."""
+    name, _, value = text.partition('=')
+    fitter, _, key = name.rpartition('.')
+    if not fitter or not key:
+        raise argparse.ArgumentTypeError(f"expected fitter.key=value, got {text!r}")
+    try:
+        return fitter, key, float(value)
+    except ValueError:
+        return fitter, key, value
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('fitters', nargs='*', default=['formula', 'rates', 'trees'])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--option', action='append', default=[], type=parse_option,
+                        help="fitter.key=value passed to that fitter, e.g. trees.depth=3")
+    args = parser.parse_args(argv)
+
+    options = {}
+    for fitter, key, value in args.option:
+        options.setdefault(fitter, {})[key] = value
+
+    columns = open_store(args.cases)
+    start = time.perf_counter()
+    report = cross_validate(args.fitters, columns, args.folds, args.workers, args.seed, options)
+    elapsed = time.perf_counter() - start
+
+    print(f"🔁 {args.folds}-fold cross-validation over {len(columns.days)} cases "
+          f"({len(args.fitters) * args.folds} fits in {elapsed:.1f}s on {args.workers or os.cpu_count()} workers)")
+    print(f"  {'fitter':<10}{'train err':>12}{'oof err':>12}{'fold sd':>10}{'oof score':>12}{'exact':>7}{'close':>7}")
+    for name, entry in report.items():
+        oof = entry['out_of_fold']
+        spread = np.std([f['test']['avg_error'] for f in entry['folds']])
+        print(f"  {name:<10}{entry['train']['avg_error']:>12.2f}{oof['avg_error']:>12.2f}{spread:>10.2f}"
+              f"{oof['score']:>12.2f}{oof['exact']:>7}{oof['close']:>7}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Segmented error report for the current model over a whole case file.
+
+Scores every case in one vectorized pass through the deployed model
+(reimbursement.load_array_model, so configured corrections count), ranks
+the residuals and groups them by trip length, miles per day, receipts per
+day and receipt band. Each segment reports its size, mean and max absolute
+error and mean signed error (positive means the model pays too much),
+worst segments first.
+
+Usage: python3 error_analytics.py [cases.json] [--top N] [--min-count N]
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from case_store import open_store
+from evaluate import array_metrics
+from reimbursement import load_array_model
+from rules import DEFAULT_RULES
+
+# Bucket edges; miles-per-day edges include the efficiency thresholds
+MILES_PER_DAY_EDGES = [50, 100, 150, 200, 300, 400]
+RECEIPTS_PER_DAY_EDGES = [25, 50, 75, 100, 150, 200, 300]
+
+
+def score_cases(columns, rules=DEFAULT_RULES):
+    """Per-case arrays for the deployed model under `rules`: inputs, prediction and residuals."""
+    days = np.asarray(columns.days, dtype=np.float64)
+    miles = np.asarray(columns.miles, dtype=np.float64)
+    receipts = np.asarray(columns.receipts, dtype=np.float64)
+    predicted = np.round(load_array_model(rules)(days, miles, receipts), 2)
+    residual = predicted - columns.expected
+    return {
+        'days': days,
+        'miles': miles,
+        'receipts': receipts,
+        'expected': np.asarray(columns.expected),
+        'predicted': predicted,
+        'residual': residual,
+        'error': np.abs(residual),
+    }
+
+
+def worst_cases(scored, n=5):
+    """Indices of the `n` largest absolute errors, worst first."""
+    n = min(n, len(scored['error']))
+    top = np.argpartition(-scored['error'], n - 1)[:n] if n else np.array([], dtype=int)
+    return top[np.argsort(-scored['error'][top], kind='stable')]
+
+
+def edge_labels(edges, unit):
+    labels = [f"<{unit}{edges[0]:g}"]
+    labels += [f"{unit}{lo:g}-{hi:g}" for lo, hi in zip(edges, edges[1:])]
+    labels.append(f"{unit}{edges[-1]:g}+")
+    return labels
+
+
+def segment_keys(scored, rules=DEFAULT_RULES):
+    """Map each grouping name to (per-case bucket index, bucket labels)."""
+    days = scored['days']
+    safe_days = np.where(days > 0, days, 1.0)
+    day_values = np.unique(days)
+    receipt_breaks = rules['receipts']['breaks']
+    return {
+        'days': (np.searchsorted(day_values, days), [f"{d:g}d" for d in day_values]),
+        'miles/day': (np.searchsorted(MILES_PER_DAY_EDGES, scored['miles'] / safe_days, side='right'),
+                      edge_labels(MILES_PER_DAY_EDGES, '')),
+        'receipts/day': (np.searchsorted(RECEIPTS_PER_DAY_EDGES, scored['receipts'] / safe_days, side='right'),
+                         edge_labels(RECEIPTS_PER_DAY_EDGES, '$')),
+        'receipt band': (np.searchsorted(receipt_breaks, scored['receipts'], side='right'),
+                         edge_labels(receipt_breaks, '$')),
+    }
+
+
+def aggregate(keys, labels, scored):
+    """Group-by over bucket indices; returns rows sorted by mean error."""
+    size = len(labels)
+    count = np.bincount(keys, minlength=size)
+    total = np.bincount(keys, weights=scored['error'], minlength=size)
+    bias = np.bincount(keys, weights=scored['residual'], minlength=size)
+    worst = np.zeros(size)
+    np.maximum.at(worst, keys, scored['error'])
+
+    rows = []
+    for i in np.flatnonzero(count):
+        rows.append({
+            'segment': labels[i],
+            'count': int(count[i]),
+            'mean_error': total[i] / count[i],
+            'max_error': worst[i],
+            'bias': bias[i] / count[i],
+        })
+    rows.sort(key=lambda row: row['mean_error'], reverse=True)
+    return rows
+
+
+def analyze(columns, rules=DEFAULT_RULES):
+    scored = score_cases(columns, rules)
+    segments = {name: aggregate(keys, labels, scored)
+                for name, (keys, labels) in segment_keys(scored, rules).items()}
+    return scored, segments
+
+
+def print_report(scored, segments, top=5, min_count=5):
+    error = scored['error']
+    metrics = array_metrics(scored['predicted'], scored['expected'])
+    print("📊 Error Analytics")
+    print("=" * 50)
+    print(f"Cases: {len(error)}  exact (±$0.01): {metrics['exact_matches']}  "
+          f"close (±$1.00): {metrics['close_matches']}  score: {metrics['score']:.2f}")
+    print(f"Mean error: ${error.mean():.2f}  median: ${np.median(error):.2f}  max: ${error.max():.2f}")
+
+    print(f"\nWorst {top} cases:")
+    for i in worst_cases(scored, top):
+        print(f"  Case {i + 1}: {scored['days'][i]:g} days, {scored['miles'][i]:g} miles, "
+              f"${scored['receipts'][i]:.2f} receipts → expected ${scored['expected'][i]:.2f}, "
+              f"got ${scored['predicted'][i]:.2f} (error ${error[i]:.2f})")
+
+    for name, rows in segments.items():
+        rows = [row for row in rows if row['count'] >= min_count]
+        print(f"\nBy {name} (worst {min(top, len(rows))} of {len(rows)} segments with ≥{min_count} cases):")
+        print(f"  {'segment':<14}{'cases':>6}{'mean':>10}{'max':>10}{'bias':>10}")
+        for row in rows[:top]:
+            print(f"  {row['segment']:<14}{row['count']:>6}{row['mean_error']:>10.2f}"
+                  f"{row['max_error']:>10.2f}{row['bias']:>+10.2f}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='?', default='public_cases.json')
+    parser.add_argument('--top', type=int, default=5)
+    parser.add_argument('--min-count', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    columns = open_store(args.cases)
+    if columns.expected is None:
+        sys.exit(f"{args.cases} has no expected outputs")
+    scored, segments = analyze(columns)
+    print_report(scored, segments, args.top, args.min_count)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""In-process replacement for the per-case loop in eval.sh.
+
+Scores the deployed model against public_cases.json in a single
+interpreter and prints the same report eval.sh does. Error arithmetic uses
+Decimal so the truncating `bc` math of eval.sh is reproduced exactly.
+With --cache, model outputs are reused from result_cache.py where the
+model and inputs are unchanged.
+
+Usage: python3 evaluate.py [cases.json] [--cache]
+"""
+import re
+import sys
+import time
+from decimal import Decimal, ROUND_DOWN
+
+from cases import load_cases
+from reimbursement import calculate_reimbursement, format_result, load_model
+
+NUMBER_RE = re.compile(r"^-?[0-9]+\.?[0-9]*$")
+
+EXACT_THRESHOLD = Decimal("0.01")
+CLOSE_THRESHOLD = Decimal("1.0")
+
+# The same thresholds for float errors between cent-rounded amounts, with
+# half a cent of slack for binary representation error
+EXACT_ERROR = 0.005
+CLOSE_ERROR = 0.995
+
+
+def _truncate(value, places):
+    # bc with `scale=N` truncates rather than rounds
+    return value.quantize(Decimal(1).scaleb(-places), rounding=ROUND_DOWN)
+
+
+def evaluate(cases, model=calculate_reimbursement):
+    """Score `model` against (days, miles, receipts, expected) tuples.
+
+    Returns a dict with the same metrics eval.sh reports.
+    """
+    results = []
+    errors = []
+    exact_matches = 0
+    close_matches = 0
+    total_error = Decimal(0)
+    max_error = Decimal(0)
+    max_error_case = ""
+
+    for i, (days, miles, receipts, expected) in enumerate(cases, start=1):
+        try:
+            output = format_result(model(days, miles, receipts))
+        except Exception as e:
+            errors.append(f"Case {i}: Script failed with error: {e}")
+            continue
+        if not NUMBER_RE.match(output):
+            errors.append(f"Case {i}: Invalid output format: {output}")
+            continue
+
+        error = abs(Decimal(output) - Decimal(str(expected)))
+        results.append((i, expected, output, error, days, miles, receipts))
+
+        if error < EXACT_THRESHOLD:
+            exact_matches += 1
+        if error < CLOSE_THRESHOLD:
+            close_matches += 1
+        total_error += error
+        if error > max_error:
+            max_error = error
+            max_error_case = f"Case {i}: {days} days, {miles} miles, ${receipts} receipts"
+
+    num_cases = len(cases)
+    successful_runs = len(results)
+    metrics = {
+        'num_cases': num_cases,
+        'successful_runs': successful_runs,
+        'exact_matches': exact_matches,
+        'close_matches': close_matches,
+        'max_error': max_error,
+        'max_error_case': max_error_case,
+        'results': results,
+        'errors': errors,
+    }
+    if successful_runs:
+        avg_error = _truncate(total_error / successful_runs, 2)
+        metrics['avg_error'] = avg_error
+        metrics['exact_pct'] = _truncate(Decimal(exact_matches * 100) / successful_runs, 1)
+        metrics['close_pct'] = _truncate(Decimal(close_matches * 100) / successful_runs, 1)
+        metrics['score'] = avg_error * 100 + (num_cases - exact_matches) * Decimal("0.1")
+    return metrics
+
+
+def eval_score(avg_error, num_cases, exact_matches):
+    """eval.sh score: average error in cents plus 0.1 per inexact case."""
+    return avg_error * 100 + (num_cases - exact_matches) * 0.1
+
+
+def array_metrics(predicted, expected):
+    """The eval.sh metrics for NumPy arrays of model outputs and expected amounts.
+
+    Outputs are rounded to cents as run.sh prints them. Besides the totals,
+    returns the per-case `error` and the `exact` / `close` masks.
+    """
+    import numpy as np
+
+    error = np.abs(np.round(predicted, 2) - expected)
+    exact = error < EXACT_ERROR
+    close = error < CLOSE_ERROR
+    exact_matches = int(np.count_nonzero(exact))
+    avg_error = float(error.mean())
+    return {
+        'error': error,
+        'exact': exact,
+        'close': close,
+        'exact_matches': exact_matches,
+        'close_matches': int(np.count_nonzero(close)),
+        'avg_error': avg_error,
+        'score': float(eval_score(avg_error, len(error), exact_matches)),
+    }
+
+
+def worst_cases(metrics, n=5):
+    return sorted(metrics['results'], key=lambda r: r[3], reverse=True)[:n]
+
+
+def print_report(metrics):
+    num_cases = metrics['num_cases']
+    exact_matches = metrics['exact_matches']
+
+    if metrics['successful_runs'] == 0:
+        print("❌ No successful test cases!")
+        print("")
+        print("Your script either:")
+        print("  - Failed to run properly")
+        print("  - Produced invalid output format")
+        print("  - Timed out on all cases")
+        print("")
+        print("Check the errors below for details.")
+    else:
+        print("✅ Evaluation Complete!")
+        print("")
+        print("📈 Results Summary:")
+        print(f"  Total test cases: {num_cases}")
+        print(f"  Successful runs: {metrics['successful_runs']}")
+        print(f"  Exact matches (±$0.01): {exact_matches} ({metrics['exact_pct']}%)")
+        print(f"  Close matches (±$1.00): {metrics['close_matches']} ({metrics['close_pct']}%)")
+        print(f"  Average error: ${metrics['avg_error']}")
+        print(f"  Maximum error: ${metrics['max_error']}")
+        print("")
+        print(f"🎯 Your Score: {metrics['score']} (lower is better)")
+        print("")
+
+        if exact_matches == num_cases:
+            print("🏆 PERFECT SCORE! You have reverse-engineered the system completely!")
+        elif exact_matches > 950:
+            print("🥇 Excellent! You are very close to the perfect solution.")
+        elif exact_matches > 800:
+            print("🥈 Great work! You have captured most of the system behavior.")
+        elif exact_matches > 500:
+            print("🥉 Good progress! You understand some key patterns.")
+        else:
+            print("📚 Keep analyzing the patterns in the interviews and test cases.")
+
+        print("")
+        print("💡 Tips for improvement:")
+        if exact_matches < num_cases:
+            print("  Check these high-error cases:")
+            for case_num, expected, actual, error, days, miles, receipts in worst_cases(metrics):
+                print(f"    Case {case_num}: {days} days, {miles} miles, ${receipts} receipts")
+                print(f"      Expected: ${expected:.2f}, Got: ${float(actual):.2f}, Error: ${error:.2f}")
+
+    errors = metrics['errors']
+    if errors:
+        print()
+        print("⚠️  Errors encountered:")
+        for line in errors[:10]:
+            print(f"  {line}")
+        if len(errors) > 10:
+            print(f"  ... and {len(errors) - 10} more errors")
+
+
+def cached_model(cases, model):
+    """`model` answering from the result cache; returns (model, cache hits)."""
+    from result_cache import ResultCache, cached_outputs
+    from rules import DEFAULT_RULES
+
+    def compute(indices):
+        outputs = []
+        for i in indices:
+            try:
+                outputs.append(format_result(model(*cases[i][:3])))
+            except Exception:
+                outputs.append(None)  # evaluate() calls the model again and reports it
+        return [output if output is not None and NUMBER_RE.match(output) else None for output in outputs]
+
+    cache = ResultCache()
+    outputs, hits = cached_outputs(cases, DEFAULT_RULES, compute, cache)
+    cache.close()
+    known = {tuple(case[:3]): output for case, output in zip(cases, outputs) if output is not None}
+
+    def answer(days, miles, receipts):
+        output = known.get((days, miles, receipts))
+        return float(output) if output is not None else model(days, miles, receipts)
+    return answer, hits
+
+
+def main(argv):
+    use_cache = '--cache' in argv and '--no-cache' not in argv
+    argv = [arg for arg in argv if arg not in ('--cache', '--no-cache')]
+    path = argv[0] if argv else 'public_cases.json'
+
+    print("🧾 Black Box Challenge - Reimbursement System Evaluation")
+    print("=======================================================")
+    print()
+
+    start = time.perf_counter()
+    cases = load_cases(path)
+    print(f"📊 Running evaluation against {len(cases):,} test cases...")
+    print()
+    model = load_model()
+    hits = None
+    if use_cache:
+        model, hits = cached_model(cases, model)
+    metrics = evaluate(cases, model)
+    elapsed = time.perf_counter() - start
+
+    print_report(metrics)
+    print()
+    reused = f" ({hits} cached)" if hits is not None else ""
+    print(f"⏱️  Evaluated {len(cases)} cases in {elapsed * 1000:.1f} ms{reused}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
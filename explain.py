@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Per-component breakdown of the deployed model, for analysts.
+
+explain() returns the per diem, mileage and receipt amounts, the efficiency
+multiplier, the amount each configured correction stage adds and the total,
+plus which band of each rule chain was taken. Amounts come from the same
+component functions the production path uses and the efficiency branch from
+reimbursement.efficiency_branch; the total is load_model()'s output. So
+calculate_reimbursement itself carries no instrumentation and costs nothing
+extra when tracing is off. Pass a BranchCounter to tally how often each band
+fires across a run.
+
+explain_arrays() does the same for the formula over whole NumPy batches.
+
+Usage: python3 explain.py <days> <miles> <receipts>
+       python3 explain.py --cases FILE       (branch counts over a case file)
+"""
+import json
+import sys
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+from reimbursement import (efficiency_branch, load_model, load_stages, mileage_amount,
+                           per_diem_amount, receipt_amount)
+from rules import COMPILED_RULES
+
+CHAINS = ('per_diem', 'five_day_bonus', 'mileage', 'receipts', 'efficiency')
+
+# (rules, load_model(rules), load_stages(rules)) per rules object explained
+_deployed = {}
+
+
+def band_label(breaks, i, inclusive):
+    """Human label of band `i`; inclusive bands are `x <= break`."""
+    le, gt = ('≤', '>') if inclusive else ('<', '≥')
+    if i == 0:
+        return f"{le}{breaks[0]:g}"
+    if i == len(breaks):
+        return f"{gt}{breaks[-1]:g}"
+    return f"{gt}{breaks[i - 1]:g} {le}{breaks[i]:g}" if inclusive else f"{breaks[i - 1]:g}–{breaks[i]:g}"
+
+
+def efficiency_labels(rules=COMPILED_RULES):
+    labels = ['none', 'one_day', 'one_day_high_receipts']
+    labels += [f"band {i} (mpd>{mpd:g})" for i, (mpd, _, _) in enumerate(rules.efficiency_bands)]
+    return labels
+
+
+class BranchCounter(Counter):
+    """Counts (chain, band label) hits across explain() calls."""
+
+    def by_chain(self):
+        grouped = {chain: {} for chain in CHAINS}
+        for (chain, label), count in sorted(self.items()):
+            grouped[chain][label] = count
+        return grouped
+
+
+def deployed(rules=COMPILED_RULES):
+    """(load_model(rules), load_stages(rules)), loaded once per rules object."""
+    if id(rules) not in _deployed:
+        _deployed[id(rules)] = (rules, load_model(rules), load_stages(rules))
+    return _deployed[id(rules)][1:]
+
+
+def explain(days, miles, receipts, rules=COMPILED_RULES, counter=None):
+    miles_per_day = miles / days if days > 0 else 0.0
+    per_diem = per_diem_amount(days, rules)
+    mileage = mileage_amount(miles, rules)
+    receipt = receipt_amount(receipts, rules)
+    branch, multiplier = efficiency_branch(days, miles, miles_per_day, receipts, rules)
+
+    model, stages = deployed(rules)
+    amount = (per_diem + mileage + receipt) * multiplier
+    corrections = {}  # stage name -> amount it adds
+    for name, stage in stages:
+        corrected = stage(days, miles, receipts, amount)
+        corrections[name] = corrected - amount
+        amount = corrected
+
+    bands = {
+        'per_diem': band_label(rules.per_diem_breaks, bisect_left(rules.per_diem_breaks, days), True),
+        'five_day_bonus': 'applied' if days == rules.bonus_days else 'not applied',
+        'mileage': band_label(rules.mileage_breaks, bisect_left(rules.mileage_breaks, miles), True),
+        'receipts': band_label(rules.receipt_breaks, bisect_right(rules.receipt_breaks, receipts), False),
+        'efficiency': efficiency_labels(rules)[branch],
+    }
+    if counter is not None:
+        counter.update(bands.items())
+
+    return {
+        'per_diem': per_diem,
+        'mileage': mileage,
+        'receipts': receipt,
+        'subtotal': per_diem + mileage + receipt,
+        'efficiency_multiplier': multiplier,
+        'corrections': corrections,
+        'total': model(days, miles, receipts),
+        'bands': bands,
+    }
+
+
+def explain_batch(cases, rules=COMPILED_RULES, counter=None):
+    return [explain(days, miles, receipts, rules, counter) for days, miles, receipts, *_ in cases]
+
+
+def explain_arrays(days, miles, receipts, rules=None):
+    """Vectorized breakdown: component arrays plus per-chain band indices.
+
+    Returns (components, bands, counts) where bands maps chain -> index array
+    and counts maps chain -> {label: hits}.
+    """
+    import numpy as np
+
+    from rules import DEFAULT_RULES, compile_rules
+    from vectorized import base_array, efficiency_array, mileage_array, receipts_array
+
+    rules = rules or DEFAULT_RULES
+    compiled = compile_rules(rules)
+    days = np.asarray(days, dtype=np.float64)
+    miles = np.asarray(miles, dtype=np.float64)
+    receipts = np.asarray(receipts, dtype=np.float64)
+
+    components = {
+        'per_diem': base_array(days, rules),
+        'mileage': mileage_array(miles, rules),
+        'receipts': receipts_array(receipts, rules),
+        'efficiency_multiplier': efficiency_array(days, miles, receipts, rules),
+    }
+    components['total'] = ((components['per_diem'] + components['mileage'] + components['receipts'])
+                           * components['efficiency_multiplier'])
+
+    positive = days > 0
+    miles_per_day = miles / np.where(positive, days, 1.0)
+    one_day = positive & (days == 1) & (miles > compiled.one_day_miles)
+    conditions = [~positive, one_day & (receipts > compiled.one_day_receipts), one_day]
+    choices = [0, 2, 1]
+    for i, (min_miles_per_day, min_receipts, _) in enumerate(compiled.efficiency_bands):
+        conditions.append((miles_per_day > min_miles_per_day) & (receipts > min_receipts))
+        choices.append(3 + i)
+
+    bands = {
+        'per_diem': np.searchsorted(compiled.per_diem_breaks, days, side='left'),
+        'five_day_bonus': (days == compiled.bonus_days).astype(np.int64),
+        'mileage': np.searchsorted(compiled.mileage_breaks, miles, side='left'),
+        'receipts': np.searchsorted(compiled.receipt_breaks, receipts, side='right'),
+        'efficiency': np.select(conditions, choices, default=0),
+    }
+    labels = {
+        'per_diem': [band_label(compiled.per_diem_breaks, i, True)
+                     for i in range(len(compiled.per_diem_breaks) + 1)],
+        'five_day_bonus': ['not applied', 'applied'],
+        'mileage': [band_label(compiled.mileage_breaks, i, True)
+                    for i in range(len(compiled.mileage_breaks) + 1)],
+        'receipts': [band_label(compiled.receipt_breaks, i, False)
+                     for i in range(len(compiled.receipt_breaks) + 1)],
+        'efficiency': efficiency_labels(compiled),
+    }
+    counts = {}
+    for chain, index in bands.items():
+        hits = np.bincount(index, minlength=len(labels[chain]))
+        counts[chain] = {labels[chain][i]: int(n) for i, n in enumerate(hits) if n}
+    return components, bands, counts
+
+
+def main(argv):
+    if len(argv) == 2 and argv[0] == '--cases':
+        from cases import iter_cases
+
+        counter = BranchCounter()
+        for case in iter_cases(argv[1]):
+            explain(case.days, case.miles, case.receipts, counter=counter)
+        print(json.dumps(counter.by_chain(), indent=2, ensure_ascii=False))
+        return
+
+    if len(argv) != 3:
+        sys.exit("Usage: explain.py <days> <miles> <receipts> | --cases FILE")
+    try:
+        days, miles, receipts = (float(arg) for arg in argv)
+    except ValueError:
+        sys.exit("Invalid input")
+    print(json.dumps(explain(days, miles, receipts), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""Integer fixed-point version of calculate_reimbursement.
+
+The float model rounds only when printing, so totals that land within a
+float's error of a half cent can print differently across implementations.
+This path does every step in integers instead:
+
+  inputs        days, miles and receipts in hundredths (all case data has
+                at most two decimals)
+  rules         rates, factors and slopes as integer millionths, breakpoints
+                and thresholds in hundredths; a rules.json value with more
+                places raises ValueError rather than being rounded, since
+                the result would no longer match the float model
+                (calibrate.py writes its rules at these precisions)
+  components    per diem, mileage and receipts in 1e-8 dollars (exact
+                products), subtotal rounded to sub-cents (1e-4 dollars)
+  multiplier    efficiency multiplier in billionths
+  result        integer cents
+
+Divisions round half away from zero (div_round), the usual rule for money.
+Results on a half cent are common, though: 0.35 x $1,141.70 is $399.595,
+and about one private case in ten lands on one. The float model prints
+such a tie on whichever side its binary value happens to fall, and run.sh's
+output is the reference. So when the result is within the rounding error
+of the subtotal and multiplier of a half cent, this path takes the cents
+the float model prints (float_cents). Everywhere else the integer result
+stands, and it matches the float model's printed output; --check confirms
+this over a case file. The scalar functions use Python ints and the array
+functions int64 NumPy. Both do the same operations in the same order and
+agree exactly.
+
+Usage: python3 fixed_point.py <days> <miles> <receipts>
+       python3 fixed_point.py --check [cases.json] [--rules FILE]   (compare with the float model)
+"""
+import sys
+from bisect import bisect_left, bisect_right
+from decimal import Decimal
+
+from reimbursement import calculate_reimbursement, format_result
+from rules import DEFAULT_RULES, compile_rules, load_rules, tier_offsets
+
+RATE_SCALE = 10 ** 6        # rates, factors and slopes
+INPUT_SCALE = 100           # days, miles, receipts and breakpoints
+EXACT_SCALE = 10 ** 8       # component amounts: INPUT_SCALE * RATE_SCALE per dollar
+SUBCENT_SCALE = 10 ** 4     # subtotal
+MULTIPLIER_SCALE = 10 ** 9  # efficiency multiplier
+# Units of subtotal x multiplier per cent of the result
+CENT_UNITS = MULTIPLIER_SCALE * SUBCENT_SCALE // 100
+
+
+def div_round(numerator, denominator):
+    """numerator / denominator rounded half away from zero; denominator > 0."""
+    quotient, remainder = divmod(abs(numerator), denominator)
+    if 2 * remainder >= denominator:
+        quotient += 1
+    return -quotient if numerator < 0 else quotient
+
+
+def div_round_array(numerator, denominator):
+    import numpy as np
+
+    quotient, remainder = np.divmod(np.abs(numerator), denominator)
+    quotient = quotient + (2 * remainder >= denominator)
+    return np.where(numerator < 0, -quotient, quotient)
+
+
+def to_fixed(value, scale, name='value'):
+    """`value` (a decimal number) as an integer count of 1/scale units.
+
+    Raises ValueError when `value` is not a whole number of units.
+    """
+    scaled = Decimal(repr(value)) * scale
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"{name} {value!r} is not a multiple of 1/{scale}; round it to "
+                         f"{len(str(scale)) - 1} decimal places for the fixed-point path")
+    return int(scaled)
+
+
+class FixedRules:
+    """rules.json scaled to integers, plus the compiled float rules that break ties."""
+
+    __slots__ = ('raw', 'compiled', 'per_diem_breaks', 'per_diem_rates', 'bonus_days', 'bonus_factor',
+                 'mileage_breaks', 'mileage_rates', 'mileage_lower', 'mileage_offsets',
+                 'receipt_breaks', 'receipt_rates',
+                 'one_day_miles', 'one_day_slope', 'one_day_receipts', 'one_day_boost',
+                 'efficiency_bands')
+
+    def __init__(self, rules):
+        self.raw = rules
+        self.compiled = compile_rules(rules)
+        per_diem = rules['per_diem']
+        self.per_diem_breaks = [to_fixed(b, INPUT_SCALE, 'per_diem.breaks') for b in per_diem['breaks']]
+        self.per_diem_rates = [to_fixed(r, RATE_SCALE, 'per_diem.rates') for r in per_diem['rates']]
+        self.bonus_days = to_fixed(rules['five_day_bonus']['days'], INPUT_SCALE, 'five_day_bonus.days')
+        self.bonus_factor = to_fixed(rules['five_day_bonus']['factor'], RATE_SCALE, 'five_day_bonus.factor')
+
+        mileage = rules['mileage']
+        self.mileage_breaks = [to_fixed(b, INPUT_SCALE, 'mileage.breaks') for b in mileage['breaks']]
+        self.mileage_rates = [to_fixed(r, RATE_SCALE, 'mileage.rates') for r in mileage['rates']]
+        # Exact integer tier offsets in EXACT_SCALE units
+        self.mileage_lower, _ = tier_offsets(self.mileage_breaks, self.mileage_rates)
+        self.mileage_offsets = [0]
+        for i, rate in enumerate(self.mileage_rates[:-1]):
+            self.mileage_offsets.append(self.mileage_offsets[-1]
+                                        + (self.mileage_breaks[i] - self.mileage_lower[i]) * rate)
+
+        receipts = rules['receipts']
+        self.receipt_breaks = [to_fixed(b, INPUT_SCALE, 'receipts.breaks') for b in receipts['breaks']]
+        self.receipt_rates = [to_fixed(r, RATE_SCALE, 'receipts.rates') for r in receipts['rates']]
+
+        one_day = rules['efficiency']['one_day']
+        self.one_day_miles = to_fixed(one_day['min_miles'], INPUT_SCALE, 'efficiency.one_day.min_miles')
+        self.one_day_slope = to_fixed(one_day['slope'], RATE_SCALE, 'efficiency.one_day.slope')
+        self.one_day_receipts = to_fixed(one_day['receipt_threshold'], INPUT_SCALE,
+                                         'efficiency.one_day.receipt_threshold')
+        self.one_day_boost = to_fixed(one_day['receipt_boost'], RATE_SCALE, 'efficiency.one_day.receipt_boost')
+        self.efficiency_bands = [
+            (to_fixed(band['min_miles_per_day'], INPUT_SCALE, 'efficiency.bands.min_miles_per_day'),
+             None if band['min_receipts'] is None
+             else to_fixed(band['min_receipts'], INPUT_SCALE, 'efficiency.bands.min_receipts'),
+             to_fixed(band['slope'], RATE_SCALE, 'efficiency.bands.slope'))
+            for band in rules['efficiency']['bands']
+        ]
+
+
+FIXED_RULES = FixedRules(DEFAULT_RULES)
+
+# Multiplier units gained by a slope (RATE_SCALE) times miles (INPUT_SCALE)
+_SLOPE_TO_MULTIPLIER = MULTIPLIER_SCALE // (RATE_SCALE * INPUT_SCALE)
+
+
+def per_diem_exact(days, rules=FIXED_RULES):
+    amount = days * rules.per_diem_rates[bisect_left(rules.per_diem_breaks, days)]
+    if days == rules.bonus_days:
+        amount = div_round(amount * rules.bonus_factor, RATE_SCALE)
+    return amount
+
+
+def mileage_exact(miles, rules=FIXED_RULES):
+    tier = bisect_left(rules.mileage_breaks, miles)
+    return rules.mileage_offsets[tier] + (miles - rules.mileage_lower[tier]) * rules.mileage_rates[tier]
+
+
+def receipts_exact(receipts, rules=FIXED_RULES):
+    return receipts * rules.receipt_rates[bisect_right(rules.receipt_breaks, receipts)]
+
+
+def multiplier_fixed(days, miles, receipts, rules=FIXED_RULES):
+    """Efficiency multiplier in MULTIPLIER_SCALE units, same branches as the float model."""
+    if days <= 0:
+        return MULTIPLIER_SCALE
+    if days == INPUT_SCALE and miles > rules.one_day_miles:
+        boost = MULTIPLIER_SCALE + (miles - rules.one_day_miles) * rules.one_day_slope * _SLOPE_TO_MULTIPLIER
+        if receipts > rules.one_day_receipts:
+            boost = div_round(boost * rules.one_day_boost, RATE_SCALE)
+        return boost
+    for min_miles_per_day, min_receipts, slope in rules.efficiency_bands:
+        # miles / days > threshold, cross-multiplied; the excess is in miles per day * INPUT_SCALE * days
+        excess = miles * INPUT_SCALE - min_miles_per_day * days
+        if excess > 0 and (min_receipts is None or receipts > min_receipts):
+            return MULTIPLIER_SCALE + div_round(excess * slope * _SLOPE_TO_MULTIPLIER, days)
+    return MULTIPLIER_SCALE
+
+
+def float_cents(days, miles, receipts, rules=FIXED_RULES):
+    """Cents the float model prints for inputs in hundredths."""
+    amount = calculate_reimbursement(days / INPUT_SCALE, miles / INPUT_SCALE, receipts / INPUT_SCALE, rules.compiled)
+    return round(float(format_result(amount)) * 100)
+
+
+def calculate_cents(days, miles, receipts, rules=FIXED_RULES):
+    """Reimbursement in integer cents for inputs in hundredths."""
+    subtotal = div_round(per_diem_exact(days, rules) + mileage_exact(miles, rules) + receipts_exact(receipts, rules),
+                         EXACT_SCALE // SUBCENT_SCALE)
+    multiplier = multiplier_fixed(days, miles, receipts, rules)
+    total = subtotal * multiplier
+    # Half a unit of rounding in each factor moves 2 x total by up to this much
+    if abs(2 * (abs(total) % CENT_UNITS) - CENT_UNITS) <= abs(subtotal) + multiplier:
+        return float_cents(days, miles, receipts, rules)  # on or next to a half cent
+    return div_round(total, CENT_UNITS)
+
+
+def to_hundredths(value):
+    return int(round(value * INPUT_SCALE))
+
+
+def calculate_reimbursement_fixed(days, miles, receipts, rules=FIXED_RULES):
+    """Drop-in for calculate_reimbursement returning a float of whole cents."""
+    return calculate_cents(to_hundredths(days), to_hundredths(miles), to_hundredths(receipts), rules) / 100
+
+
+def format_cents(cents):
+    sign = '-' if cents < 0 else ''
+    return f"{sign}{abs(cents) // 100}.{abs(cents) % 100:02d}"
+
+
+def calculate_cents_array(days, miles, receipts, rules=FIXED_RULES):
+    """Vectorized calculate_cents over float inputs; returns int64 cents."""
+    import numpy as np
+
+    days = np.rint(np.asarray(days, dtype=np.float64) * INPUT_SCALE).astype(np.int64)
+    miles = np.rint(np.asarray(miles, dtype=np.float64) * INPUT_SCALE).astype(np.int64)
+    receipts = np.rint(np.asarray(receipts, dtype=np.float64) * INPUT_SCALE).astype(np.int64)
+
+    per_diem = days * np.asarray(rules.per_diem_rates)[np.searchsorted(rules.per_diem_breaks, days, side='left')]
+    per_diem = np.where(days == rules.bonus_days,
+                        div_round_array(per_diem * rules.bonus_factor, RATE_SCALE), per_diem)
+
+    tier = np.searchsorted(rules.mileage_breaks, miles, side='left')
+    mileage = (np.asarray(rules.mileage_offsets)[tier]
+               + (miles - np.asarray(rules.mileage_lower)[tier]) * np.asarray(rules.mileage_rates)[tier])
+    receipt = receipts * np.asarray(rules.receipt_rates)[np.searchsorted(rules.receipt_breaks, receipts, side='right')]
+    subtotal = div_round_array(per_diem + mileage + receipt, EXACT_SCALE // SUBCENT_SCALE)
+
+    positive = days > 0
+    safe_days = np.where(positive, days, 1)
+    boost = MULTIPLIER_SCALE + (miles - rules.one_day_miles) * rules.one_day_slope * _SLOPE_TO_MULTIPLIER
+    boost = np.where(receipts > rules.one_day_receipts,
+                     div_round_array(boost * rules.one_day_boost, RATE_SCALE), boost)
+    conditions = [~positive, (days == INPUT_SCALE) & (miles > rules.one_day_miles)]
+    choices = [MULTIPLIER_SCALE, boost]
+    for min_miles_per_day, min_receipts, slope in rules.efficiency_bands:
+        excess = miles * INPUT_SCALE - min_miles_per_day * days
+        condition = excess > 0
+        if min_receipts is not None:
+            condition = condition & (receipts > min_receipts)
+        conditions.append(condition)
+        choices.append(MULTIPLIER_SCALE + div_round_array(excess * slope * _SLOPE_TO_MULTIPLIER, safe_days))
+    multiplier = np.select(conditions, choices, default=MULTIPLIER_SCALE)
+
+    total = subtotal * multiplier
+    cents = div_round_array(total, CENT_UNITS)
+    ties = np.flatnonzero(np.abs(2 * (np.abs(total) % CENT_UNITS) - CENT_UNITS) <= np.abs(subtotal) + multiplier)
+    if len(ties):
+        from vectorized import calculate_reimbursement_array
+
+        amounts = calculate_reimbursement_array(days[ties] / INPUT_SCALE, miles[ties] / INPUT_SCALE,
+                                                receipts[ties] / INPUT_SCALE, rules.raw)
+        cents[ties] = [round(float(format_result(amount)) * 100) for amount in amounts.tolist()]
+    return cents
+
+
+def format_cents_array(cents):
+    return [format_cents(c) for c in cents.tolist()]
+
+
+def check(path, rules=DEFAULT_RULES):
+    """Compare scalar, array and float outputs over a case file under raw `rules`."""
+    import numpy as np
+
+    from cases import load_cases
+
+    fixed = FixedRules(rules)
+    cases = load_cases(path)
+    scalar = [format_cents(calculate_cents(to_hundredths(c.days), to_hundredths(c.miles), to_hundredths(c.receipts),
+                                           fixed))
+              for c in cases]
+    array = format_cents_array(calculate_cents_array(*(np.array([c[i] for c in cases]) for i in range(3)), fixed))
+    floats = [format_result(calculate_reimbursement(c.days, c.miles, c.receipts, fixed.compiled)) for c in cases]
+    split = sum(s != a for s, a in zip(scalar, array))
+    differ = [(c, s, f) for c, s, f in zip(cases, scalar, floats) if s != f]
+    print(f"{len(cases)} cases: scalar vs array {split} mismatches, fixed vs float {len(differ)} differences")
+    for case, fixed, flt in differ[:10]:
+        print(f"  {case.days:g} {case.miles:g} {case.receipts:g}: fixed {fixed}, float {flt}")
+    return split == 0 and not differ
+
+
+def main(argv):
+    if argv[:1] == ['--check']:
+        args = argv[1:]
+        rules = DEFAULT_RULES
+        if '--rules' in args:
+            i = args.index('--rules')
+            if i + 1 == len(args):
+                sys.exit("--rules needs a file")
+            rules = load_rules(args[i + 1])
+            del args[i:i + 2]
+        try:
+            ok = check(args[0] if args else 'private_cases.json', rules)
+        except ValueError as e:
+            sys.exit(f"❌ {e}")
+        sys.exit(0 if ok else 1)
+    if len(argv) != 3:
+        sys.exit("Usage: fixed_point.py <days> <miles> <receipts> | --check [cases.json] [--rules FILE]")
+    try:
+        days, miles, receipts = (to_hundredths(float(arg)) for arg in argv)
+    except ValueError:
+        sys.exit("Invalid input")
+    print(format_cents(calculate_cents(days, miles, receipts)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Parallel replacement for the per-case loop in generate_results.sh.
+
+Loads the cases once, scores contiguous chunks in a process pool and writes
+private_results.txt in the original case order. Failed cases produce an
+ERROR line and the same stderr diagnostics generate_results.sh prints.
+
+With --cache, outputs are looked up in result_cache.py first and only the
+misses are scored, so rerunning with an unchanged model does no model work.
+The output file is replaced atomically, never left half written.
+
+Usage: python3 generate_results.py [--workers N] [--cases FILE] [--output FILE] [--cache [FILE]]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cases import iter_cases
+from evaluate import NUMBER_RE
+from reimbursement import format_result, load_model
+from result_cache import CACHE_PATH, ResultCache, cached_outputs, write_atomic
+from rules import DEFAULT_RULES
+
+
+def score_chunk(numbers, chunk):
+    """Score one chunk; returns (lines, diagnostics) with diagnostics naming `numbers`."""
+    model = load_model()
+    lines = []
+    diagnostics = []
+    for case_num, (days, miles, receipts) in zip(numbers, chunk):
+        try:
+            output = format_result(model(days, miles, receipts))
+        except Exception as e:
+            diagnostics.append(f"Error on case {case_num}: Script failed: {e}")
+            lines.append("ERROR")
+            continue
+        if NUMBER_RE.match(output):
+            lines.append(output)
+        else:
+            diagnostics.append(f"Error on case {case_num}: Invalid output format: {output}")
+            lines.append("ERROR")
+    return lines, diagnostics
+
+
+def split_chunks(numbers, cases, num_chunks):
+    size = max(1, -(-len(cases) // num_chunks))
+    return [(numbers[i:i + size], cases[i:i + size]) for i in range(0, len(cases), size)]
+
+
+def generate(cases, workers=None, numbers=None):
+    """Return the output lines for `cases`, in order, plus diagnostics.
+
+    `numbers` are the case numbers diagnostics report (default 1..).
+    """
+    numbers = numbers or list(range(1, len(cases) + 1))
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(cases) < 2:
+        return score_chunk(numbers, cases)
+
+    # A few chunks per worker keeps the pool busy when chunk costs differ
+    chunks = split_chunks(numbers, cases, workers * 4)
+    lines = []
+    diagnostics = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(score_chunk, chunk_numbers, chunk) for chunk_numbers, chunk in chunks]
+        for future in futures:
+            chunk_lines, chunk_diagnostics = future.result()
+            lines.extend(chunk_lines)
+            diagnostics.extend(chunk_diagnostics)
+    return lines, diagnostics
+
+
+def generate_cached(cases, workers, cache):
+    """generate() with per-case results reused from `cache`; adds the hit count."""
+    diagnostics = []
+
+    def compute(indices):
+        lines, failures = generate([cases[i] for i in indices], workers, [i + 1 for i in indices])
+        diagnostics.extend(failures)
+        return [None if line == "ERROR" else line for line in lines]
+
+    outputs, hits = cached_outputs(cases, DEFAULT_RULES, compute, cache)
+    return ["ERROR" if output is None else output for output in outputs], diagnostics, hits
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: CPU count)")
+    parser.add_argument('--cases', default='private_cases.json')
+    parser.add_argument('--output', default='private_results.txt')
+    parser.add_argument('--cache', nargs='?', const=CACHE_PATH, default=None,
+                        help="reuse results from the result cache (at FILE)")
+    parser.add_argument('--no-cache', action='store_true', help="score every case (the default)")
+    args = parser.parse_args(argv)
+
+    print("🧾 Black Box Challenge - Generating Private Results")
+    print("====================================================")
+    print()
+
+    start = time.perf_counter()
+    cases = [case[:3] for case in iter_cases(args.cases)]
+    print(f"Processing {len(cases)} test cases...", file=sys.stderr)
+
+    if args.no_cache or args.cache is None:
+        lines, diagnostics = generate(cases, args.workers)
+    else:
+        cache = ResultCache(args.cache)
+        lines, diagnostics, hits = generate_cached(cases, args.workers, cache)
+        cache.close()
+        print(f"♻️  {hits} of {len(cases)} results reused from the cache", file=sys.stderr)
+    for line in diagnostics:
+        print(line, file=sys.stderr)
+
+    write_atomic(args.output, lines)
+    elapsed = time.perf_counter() - start
+
+    print(f"✅ Results generated successfully in {elapsed:.2f}s!", file=sys.stderr)
+    print(f"📄 Output saved to {args.output}", file=sys.stderr)
+    print(f"📊 Each line contains the result for the corresponding test case in {args.cases}",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Fit every rate at once by least squares on hinge features.
+
+isolate_formula.py, reverse_engineer.py and receipt_analysis.py estimate one
+rate at a time from residuals of earlier guesses. Here, for a given set of
+breakpoints, the expected amounts are regressed in one solve on:
+
+  intercept
+  per_diem        days x [days in band i]                 (per diem rate per band)
+  five_day        days x [days == bonus length]
+  mileage         miles, max(0, miles - b) per breakpoint (tier rate changes)
+  receipts        receipts x [band i], [band i > 0]       (rate per band, offset
+                                                          relative to band 0)
+  miles_per_day   h = max(0, miles/days - t), h x days    per efficiency threshold
+
+Band 0 has no offset column, since the band indicators would sum to the
+intercept and leave the design rank deficient.
+
+The design matrix and its Gram matrix (X'X, X'y) are cached. Moving one
+breakpoint recomputes only the columns that depend on it and their Gram
+rows, then re-solves the small normal equations. A breakpoint search
+therefore tries each candidate in about a hundred microseconds on the
+public cases, rather than rebuilding and refactoring the full matrix.
+Candidates must leave at least --min-segment cases (default 30) on each
+side of a breakpoint, up to its neighbours, so the search cannot fit a
+segment of a handful of cases with an extreme rate.
+
+Usage: python3 hinge_fit.py [--cases FILE] [--search] [--passes N] [--min-segment N]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from case_store import open_store
+from rules import DEFAULT_RULES
+
+GROUPS = ('intercept', 'per_diem', 'five_day', 'mileage', 'receipts', 'miles_per_day')
+
+# Breakpoint search grid step per group
+SEARCH_STEP = {'per_diem': 1, 'mileage': 5, 'receipts': 5, 'miles_per_day': 5}
+# Fewest cases a candidate breakpoint may leave between itself and each neighbour
+MIN_SEGMENT = 30
+
+
+def default_breaks(rules=DEFAULT_RULES):
+    return {
+        'per_diem': list(rules['per_diem']['breaks']),
+        'mileage': list(rules['mileage']['breaks']),
+        'receipts': list(rules['receipts']['breaks']),
+        'miles_per_day': sorted(band['min_miles_per_day'] for band in rules['efficiency']['bands']),
+    }
+
+
+class HingeDesign:
+    def __init__(self, days, miles, receipts, expected, breaks=None, bonus_days=5, ridge=1e-8,
+                 min_segment=MIN_SEGMENT):
+        self.days = np.asarray(days, dtype=np.float64)
+        self.miles = np.asarray(miles, dtype=np.float64)
+        self.receipts = np.asarray(receipts, dtype=np.float64)
+        self.y = np.asarray(expected, dtype=np.float64)
+        self.miles_per_day = self.miles / np.where(self.days > 0, self.days, 1.0)
+        self.bonus_days = bonus_days
+        self.ridge = ridge
+        self.min_segment = min_segment
+        self.breaks = {group: list(values) for group, values in (breaks or default_breaks()).items()}
+
+        self.slices = {}
+        start = 0
+        for group in GROUPS:
+            width = self.group_width(group)
+            self.slices[group] = slice(start, start + width)
+            start += width
+        self.X = np.empty((len(self.y), start), order='F')  # column-major: updates touch whole columns
+        for group in GROUPS:
+            band = self.band(group)
+            for k in range(self.group_width(group)):
+                self.X[:, self.slices[group].start + k] = self.column(group, k, band)
+        self.gram = self.X.T @ self.X
+        self.Xty = self.X.T @ self.y
+        self.yy = float(self.y @ self.y)
+
+    def group_width(self, group):
+        if group in ('intercept', 'five_day'):
+            return 1
+        n = len(self.breaks[group])
+        return {'per_diem': n + 1, 'mileage': n + 1, 'receipts': 2 * n + 1, 'miles_per_day': 2 * n}[group]
+
+    def band(self, group):
+        """Band index per case for the banded groups, else None."""
+        if group == 'per_diem':
+            return np.searchsorted(self.breaks[group], self.days, side='left')
+        if group == 'receipts':
+            return np.searchsorted(self.breaks[group], self.receipts, side='right')
+        return None
+
+    def column(self, group, k, band=None):
+        """Local column `k` of `group` under the current breakpoints.
+
+        `band` is self.band(group), passed in when building several columns.
+        """
+        if group == 'intercept':
+            return np.ones_like(self.y)
+        if group == 'five_day':
+            return self.days * (self.days == self.bonus_days)
+        if band is None:
+            band = self.band(group)
+        breaks = self.breaks[group]
+        if group == 'per_diem':
+            return self.days * (band == k)
+        if group == 'mileage':
+            return self.miles if k == 0 else np.maximum(self.miles - breaks[k - 1], 0.0)
+        if group == 'receipts':
+            # Rate of band 0, then rate and offset of bands 1..n
+            in_band = band == (k + 1) // 2
+            return self.receipts * in_band if k == 0 or k % 2 == 1 else in_band.astype(np.float64)
+        hinge = np.maximum(self.miles_per_day - breaks[k // 2], 0.0)
+        return hinge if k % 2 == 0 else hinge * self.days
+
+    def dependent(self, group, j):
+        """Global column indices that move with breakpoint `j` of `group`."""
+        base = self.slices[group].start
+        local = {
+            'per_diem': [j, j + 1],
+            'mileage': [j + 1],
+            'receipts': ([0] if j == 0 else [2 * j - 1, 2 * j]) + [2 * j + 1, 2 * j + 2],
+            'miles_per_day': [2 * j, 2 * j + 1],
+        }[group]
+        return [base + k for k in local]
+
+    def set_break(self, group, j, value):
+        """Move one breakpoint, refreshing only its columns and Gram rows."""
+        self.breaks[group][j] = value
+        columns = self.dependent(group, j)
+        start = self.slices[group].start
+        band = self.band(group)
+        for c in columns:
+            self.X[:, c] = self.column(group, c - start, band)
+        block = self.X[:, columns].T @ self.X
+        self.gram[columns, :] = block
+        self.gram[:, columns] = block.T
+        self.Xty[columns] = self.X[:, columns].T @ self.y
+
+    def solve(self):
+        """(coefficients, sum of squared errors) for the current breakpoints."""
+        gram = self.gram + self.ridge * np.diag(np.diag(self.gram) + 1.0)
+        coef = np.linalg.solve(gram, self.Xty)
+        sse = self.yy - 2 * coef @ self.Xty + coef @ self.gram @ coef
+        return coef, float(sse)
+
+    def try_break(self, group, j, value):
+        """SSE with breakpoint `j` of `group` at `value`, leaving the design unchanged."""
+        columns = self.dependent(group, j)
+        saved = (self.breaks[group][j], self.X[:, columns].copy(), self.gram[columns, :].copy(),
+                 self.Xty[columns].copy())
+        self.set_break(group, j, value)
+        _, sse = self.solve()
+        old, X, rows, Xty = saved
+        self.breaks[group][j] = old
+        self.X[:, columns] = X
+        self.gram[columns, :] = rows
+        self.gram[:, columns] = rows.T
+        self.Xty[columns] = Xty
+        return sse
+
+    def support(self, group):
+        """(sorted values, searchsorted side) counting the cases below a breakpoint of `group`.
+
+        Bonus-length trips have their own per diem column, so they do not
+        support a per diem band.
+        """
+        if group == 'per_diem':
+            return np.sort(self.days[self.days != self.bonus_days]), 'right'
+        if group == 'receipts':
+            return np.sort(self.receipts), 'left'
+        return np.sort(self.miles if group == 'mileage' else self.miles_per_day), 'right'
+
+    def candidates(self, group, j):
+        """Grid values between breakpoint j's neighbours leaving min_segment cases on each side."""
+        breaks = self.breaks[group]
+        step = SEARCH_STEP[group]
+        values, side = self.support(group)
+        lo = breaks[j - 1] if j > 0 else 0
+        hi = breaks[j + 1] if j + 1 < len(breaks) else values[-1]
+        grid = np.arange(lo + step, hi, step)
+        below = np.searchsorted(values, grid, side)
+        lo_count = np.searchsorted(values, lo, side) if j > 0 else 0
+        hi_count = np.searchsorted(values, hi, side) if j + 1 < len(breaks) else len(values)
+        keep = (below - lo_count >= self.min_segment) & (hi_count - below >= self.min_segment)
+        return [v for v in grid[keep].tolist() if v != breaks[j]]
+
+    def search(self, passes=3):
+        """Coordinate search over every breakpoint; returns evaluations made."""
+        evaluations = 0
+        _, best = self.solve()
+        for _ in range(passes):
+            improved = False
+            for group in SEARCH_STEP:
+                for j in range(len(self.breaks[group])):
+                    for value in self.candidates(group, j):
+                        sse = self.try_break(group, j, value)
+                        evaluations += 1
+                        if sse < best - 1e-6:
+                            best = sse
+                            self.set_break(group, j, value)
+                            improved = True
+            if not improved:
+                break
+        return evaluations
+
+    def predictor(self):
+        """predict(days, miles, receipts) with the fitted coefficients and current breakpoints."""
+        coef, _ = self.solve()
+        breaks = {group: list(values) for group, values in self.breaks.items()}
+        bonus_days = self.bonus_days
+
+        def predict(days, miles, receipts):
+            design = HingeDesign(days, miles, receipts, np.zeros(len(np.atleast_1d(days))), breaks, bonus_days,
+                                 min_segment=0)
+            return design.X @ coef
+        return predict
+
+    def report(self):
+        coef, sse = self.solve()
+        lines = []
+        for group in GROUPS:
+            values = coef[self.slices[group]]
+            lines.append(f"  {group:<14}{' '.join(f'{v:10.4f}' for v in values)}")
+            if group in self.breaks:
+                lines.append(f"  {'':<14}breaks: {', '.join(f'{b:g}' for b in self.breaks[group])}")
+        mileage = coef[self.slices['mileage']]
+        lines.append(f"  implied mileage tier rates: {', '.join(f'{r:.4f}' for r in np.cumsum(mileage))}")
+        return '\n'.join(lines)
+
+
+def fit_hinge(days, miles, receipts, expected, search=0, passes=3, min_segment=MIN_SEGMENT):
+    """cross_validate.py fitter; search=1 also moves the breakpoints."""
+    design = HingeDesign(days, miles, receipts, expected, min_segment=int(min_segment))
+    if search:
+        design.search(int(passes))
+    return design.predictor()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--search', action='store_true', help="search the breakpoints too")
+    parser.add_argument('--passes', type=int, default=3)
+    parser.add_argument('--min-segment', type=int, default=MIN_SEGMENT,
+                        help="fewest cases between a searched breakpoint and each neighbour")
+    args = parser.parse_args(argv)
+
+    columns = open_store(args.cases)
+    start = time.perf_counter()
+    design = HingeDesign(columns.days, columns.miles, columns.receipts, columns.expected,
+                         min_segment=args.min_segment)
+    built = time.perf_counter() - start
+    print(f"Design matrix {design.X.shape[0]} x {design.X.shape[1]} built in {built * 1000:.1f} ms")
+
+    if args.search:
+        start = time.perf_counter()
+        evaluations = design.search(args.passes)
+        elapsed = time.perf_counter() - start
+        print(f"Breakpoint search: {evaluations} candidates in {elapsed:.2f}s "
+              f"({elapsed / max(evaluations, 1) * 1e6:.0f} µs each)")
+
+    coef, sse = design.solve()
+    predicted = design.X @ coef
+    error = np.abs(np.round(predicted, 2) - design.y)
+    print(f"📐 Least-squares fit: average error ${error.mean():.2f}, RMSE ${np.sqrt(sse / len(design.y)):.2f}, "
+          f"max ${error.max():.2f}")
+    print(design.report())
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
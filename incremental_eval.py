@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""Incremental re-scoring for interactive rule tuning.
+
+IncrementalEvaluator scores every case once, records which band of each
+rule chain it falls in and keeps its per-case error in integer cents. When
+one rule changes, only the cases that rule can reach are re-scored and the
+aggregate metrics are patched by the difference:
+
+  rate of band i (per diem, receipts)      cases in band i
+  rate of mileage tier i                   tiers i and up (cumulative)
+  breakpoint i (per diem, receipts)        bands i and i + 1
+  breakpoint i (mileage)                   tiers i and up
+  five-day bonus                           trips of the old or new bonus length
+  one-day efficiency settings              1-day trips
+  efficiency band j slope                  cases in band j
+  efficiency band j thresholds             band j, later bands and no-band cases
+
+Errors are whole cents, so the patched totals stay exactly equal to a full
+re-evaluation.
+
+Usage: python3 incremental_eval.py [--verify] path=value [path=value ...]
+       e.g. mileage.rates.3=0.3 efficiency.one_day.receipt_boost=1.1
+"""
+import copy
+import sys
+
+import numpy as np
+
+from calibrate import get_knob, set_knob
+from case_store import open_store
+from evaluate import eval_score
+from explain import explain_arrays
+from rules import DEFAULT_RULES
+from vectorized import calculate_reimbursement_array
+
+CHAINS = ('per_diem', 'mileage', 'receipts', 'efficiency')
+
+
+def to_cents(values):
+    """Cents of each value as printed with :.2f."""
+    return np.array([int(round(round(v, 2) * 100)) for v in np.asarray(values).tolist()],
+                    dtype=np.int64)
+
+
+class BandIndex:
+    """Case indices grouped by band for one rule chain."""
+
+    def __init__(self, bands):
+        self.bands = np.asarray(bands, dtype=np.int64)
+        self._rebuild()
+
+    def _rebuild(self):
+        self.order = np.argsort(self.bands, kind='stable')
+        self.sorted_bands = self.bands[self.order]
+
+    def members(self, bands):
+        """Indices of the cases in any of `bands`."""
+        parts = []
+        for band in bands:
+            lo = np.searchsorted(self.sorted_bands, band, side='left')
+            hi = np.searchsorted(self.sorted_bands, band, side='right')
+            parts.append(self.order[lo:hi])
+        return np.concatenate(parts) if parts else np.empty(0, dtype=np.int64)
+
+    def at_least(self, band):
+        lo = np.searchsorted(self.sorted_bands, band, side='left')
+        return self.order[lo:]
+
+    def move(self, rows, new_bands):
+        changed = self.bands[rows] != new_bands
+        if changed.any():
+            self.bands[rows] = new_bands
+            self._rebuild()
+
+
+class IncrementalEvaluator:
+    def __init__(self, columns, rules=DEFAULT_RULES):
+        self.rules = copy.deepcopy(rules)
+        self.days = np.asarray(columns.days, dtype=np.float64)
+        self.miles = np.asarray(columns.miles, dtype=np.float64)
+        self.receipts = np.asarray(columns.receipts, dtype=np.float64)
+        self.expected_cents = to_cents(columns.expected)
+        self.last_rescored = 0
+
+        _, bands, _ = explain_arrays(self.days, self.miles, self.receipts, self.rules)
+        self.index = {chain: BandIndex(bands[chain]) for chain in CHAINS}
+        self.index['days'] = BandIndex(self.days)
+
+        self.error_cents = self._errors(np.arange(len(self.days)))
+        self.total_cents = int(self.error_cents.sum())
+        self.exact = int(np.count_nonzero(self.error_cents == 0))
+        self.close = int(np.count_nonzero(self.error_cents < 100))
+
+    def _errors(self, rows):
+        predicted = calculate_reimbursement_array(self.days[rows], self.miles[rows],
+                                                  self.receipts[rows], self.rules)
+        return np.abs(to_cents(predicted) - self.expected_cents[rows])
+
+    def _rescore(self, rows):
+        """Re-score `rows` under the current rules and patch the aggregates."""
+        rows = np.unique(rows)
+        old = self.error_cents[rows]
+        new = self._errors(rows)
+        self.error_cents[rows] = new
+        self.total_cents += int(new.sum() - old.sum())
+        self.exact += int(np.count_nonzero(new == 0) - np.count_nonzero(old == 0))
+        self.close += int(np.count_nonzero(new < 100) - np.count_nonzero(old < 100))
+
+        _, bands, _ = explain_arrays(self.days[rows], self.miles[rows], self.receipts[rows], self.rules)
+        for chain in CHAINS:
+            self.index[chain].move(rows, bands[chain])
+        self.last_rescored = len(rows)
+
+    def affected(self, path, old, new):
+        """Indices of the cases a change of `path` from `old` to `new` can alter."""
+        group = path[0]
+        if group in ('per_diem', 'receipts'):
+            index = self.index[group]
+            i = path[2]
+            return index.members([i] if path[1] == 'rates' else [i, i + 1])
+        if group == 'mileage':
+            return self.index['mileage'].at_least(path[2])
+        if group == 'five_day_bonus':
+            bonus_days = self.rules['five_day_bonus']['days']
+            lengths = {old, new} if path[1] == 'days' else {bonus_days}
+            return self.index['days'].members(sorted(lengths))
+        if group == 'efficiency':
+            if path[1] == 'one_day':
+                return self.index['days'].members([1])
+            j = 3 + path[2]
+            index = self.index['efficiency']
+            if path[3] == 'slope':
+                return index.members([j])
+            return np.concatenate([index.at_least(j), index.members([0])])
+        raise KeyError(f"Not a model rule: {'.'.join(map(str, path))}")
+
+    def set(self, path, value):
+        """Change one rule; returns the number of cases re-scored."""
+        old = get_knob(self.rules, path)
+        rows = self.affected(path, old, value)
+        set_knob(self.rules, path, value)
+        self._rescore(rows)
+        return self.last_rescored
+
+    def metrics(self):
+        n = len(self.error_cents)
+        avg_cents = self.total_cents // n  # eval.sh truncates to 2 places
+        return {
+            'exact_matches': self.exact,
+            'close_matches': self.close,
+            'avg_error': avg_cents / 100,
+            'score': round(eval_score(avg_cents / 100, n, self.exact), 2),
+        }
+
+
+def parse_assignment(text):
+    name, _, value = text.partition('=')
+    path = tuple(int(part) if part.isdigit() else part for part in name.split('.'))
+    return path, float(value)
+
+
+def main(argv):
+    verify = '--verify' in argv
+    assignments = [parse_assignment(arg) for arg in argv if arg != '--verify']
+
+    evaluator = IncrementalEvaluator(open_store('public_cases.json'))
+    print(f"Baseline: {evaluator.metrics()}")
+    for path, value in assignments:
+        before = evaluator.metrics()
+        rescored = evaluator.set(path, value)
+        after = evaluator.metrics()
+        deltas = ', '.join(f"{k} {before[k]:g}→{after[k]:g}" for k in after if after[k] != before[k])
+        print(f"{'.'.join(map(str, path))} = {value:g}: re-scored {rescored} cases; {deltas or 'no change'}")
+
+    if verify:
+        full = IncrementalEvaluator(open_store('public_cases.json'), evaluator.rules)
+        same = full.metrics() == evaluator.metrics() and np.array_equal(full.error_cents, evaluator.error_cents)
+        print("Verified against full re-evaluation" if same else "MISMATCH with full re-evaluation")
+        sys.exit(0 if same else 1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""Nearest-neighbour residual correction over the public cases.
+
+Indexes public_cases.json in a KD-tree over (days, miles, receipts), each
+axis divided by its standard deviation, storing for every case the residual
+(expected - formula). A query adds the inverse-distance weighted mean
+residual of its k nearest cases to the formula's amount.
+
+The tree is built once by `python3 knn_correction.py build` and saved to
+knn_index.json: points are stored in tree order with the split axis of every
+internal node, so loading is a plain JSON read and queries walk the implicit
+tree directly. The index records the formula rules digest and refuses to
+load after rules.json changes.
+
+Enable it in rules.json with a correction entry such as
+    {"stage": "knn", "k": 5}
+
+Usage: python3 knn_correction.py build [--cases FILE] [--k N]
+"""
+import heapq
+import json
+import math
+import os
+import sys
+
+from rules import DEFAULT_RULES, rules_digest
+
+INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knn_index.json')
+
+LEAF_SIZE = 8
+DEFAULT_K = 5
+# Added to distances so an exact match dominates without dividing by zero
+EPSILON = 1e-6
+
+
+class KDTree:
+    """Implicit KD-tree over 3-d points stored in tree order.
+
+    The node for positions [lo, hi) splits at mid = (lo + hi) // 2 on
+    axis[mid]; ranges of LEAF_SIZE or fewer points are scanned linearly.
+    """
+
+    def __init__(self, points, axis, leaf_size=LEAF_SIZE):
+        self.points = points
+        self.axis = axis
+        self.leaf_size = leaf_size
+
+    @classmethod
+    def build(cls, points, leaf_size=LEAF_SIZE):
+        """Build from a list of 3-tuples; returns (tree, order) where
+        order[i] is the input index of the tree's i-th point."""
+        order = list(range(len(points)))
+        axis = [-1] * len(points)
+
+        def split(lo, hi):
+            if hi - lo <= leaf_size:
+                return
+            spreads = [max(points[i][a] for i in order[lo:hi]) - min(points[i][a] for i in order[lo:hi])
+                       for a in range(3)]
+            a = spreads.index(max(spreads))
+            order[lo:hi] = sorted(order[lo:hi], key=lambda i: points[i][a])
+            mid = (lo + hi) // 2
+            axis[mid] = a
+            split(lo, mid)
+            split(mid + 1, hi)
+
+        split(0, len(points))
+        return cls([points[i] for i in order], axis, leaf_size), order
+
+    def query(self, q, k, exclude=-1):
+        """Return [(distance, position)] of the k nearest points, nearest first.
+
+        `exclude` skips one position, for leave-one-out scoring.
+        """
+        points = self.points
+        axis = self.axis
+        leaf_size = self.leaf_size
+        heap = []  # max-heap of (-squared distance, position)
+
+        def consider(i):
+            if i == exclude:
+                return
+            p = points[i]
+            d2 = (p[0] - q[0]) ** 2 + (p[1] - q[1]) ** 2 + (p[2] - q[2]) ** 2
+            if len(heap) < k:
+                heapq.heappush(heap, (-d2, i))
+            elif d2 < -heap[0][0]:
+                heapq.heapreplace(heap, (-d2, i))
+
+        def search(lo, hi):
+            if hi - lo <= leaf_size:
+                for i in range(lo, hi):
+                    consider(i)
+                return
+            mid = (lo + hi) // 2
+            a = axis[mid]
+            diff = q[a] - points[mid][a]
+            consider(mid)
+            if diff < 0:
+                search(lo, mid)
+                if len(heap) < k or diff * diff < -heap[0][0]:
+                    search(mid + 1, hi)
+            else:
+                search(mid + 1, hi)
+                if len(heap) < k or diff * diff < -heap[0][0]:
+                    search(lo, mid)
+
+        search(0, len(points))
+        return sorted((math.sqrt(-d2), i) for d2, i in heap)
+
+
+class ResidualIndex:
+    """KD-tree of normalized public cases with their formula residuals."""
+
+    def __init__(self, scale, tree, residuals, k=DEFAULT_K):
+        self.scale = scale
+        self.tree = tree
+        self.residuals = residuals
+        self.k = k
+
+    def normalize(self, days, miles, receipts):
+        sd, sm, sr = self.scale
+        return (days / sd, miles / sm, receipts / sr)
+
+    def correction(self, days, miles, receipts, k=None, exclude=-1):
+        neighbours = self.tree.query(self.normalize(days, miles, receipts), k or self.k, exclude)
+        total = 0.0
+        weights = 0.0
+        for distance, i in neighbours:
+            w = 1.0 / (distance + EPSILON)
+            total += w * self.residuals[i]
+            weights += w
+        return total / weights if weights else 0.0
+
+    def to_json(self, digest):
+        return {
+            'digest': digest,
+            'k': self.k,
+            'scale': list(self.scale),
+            'leaf_size': self.tree.leaf_size,
+            'points': [list(p) for p in self.tree.points],
+            'axis': self.tree.axis,
+            'residuals': self.residuals,
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        tree = KDTree([tuple(p) for p in data['points']], data['axis'], data['leaf_size'])
+        return cls(tuple(data['scale']), tree, data['residuals'], data['k'])
+
+
+def build_index(cases, formula, k=DEFAULT_K):
+    """Index (days, miles, receipts, expected) cases by `formula` residual."""
+    columns = list(zip(*[case[:3] for case in cases]))
+    scale = []
+    for values in columns:
+        mean = sum(values) / len(values)
+        std = math.sqrt(sum((v - mean) ** 2 for v in values) / len(values))
+        scale.append(std or 1.0)
+    scale = tuple(scale)
+
+    points = [(d / scale[0], m / scale[1], r / scale[2]) for d, m, r, _ in cases]
+    tree, order = KDTree.build(points)
+    residuals = [cases[i][3] - formula(*cases[i][:3]) for i in order]
+    return ResidualIndex(scale, tree, residuals, k)
+
+
+def save_index(index, path=INDEX_PATH, rules=DEFAULT_RULES):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index.to_json(rules_digest(rules)), f, separators=(',', ':'))
+    os.replace(tmp_path, path)
+
+
+def load_index(path=INDEX_PATH, rules=DEFAULT_RULES):
+    with open(path, 'r') as f:
+        data = json.load(f)
+    if data['digest'] != rules_digest(rules):
+        raise ValueError(f"{path} was built for different rules; rebuild with knn_correction.py build")
+    return ResidualIndex.from_json(data)
+
+
+def make_stage(config, rules=DEFAULT_RULES):
+    """Correction stage for reimbursement.load_model under raw `rules`."""
+    index = load_index(config.get('index', INDEX_PATH), rules)
+    k = config.get('k', index.k)
+
+    def stage(days, miles, receipts, amount):
+        return amount + index.correction(days, miles, receipts, k)
+    return stage
+
+
+def main(argv):
+    import argparse
+    import time
+
+    from cases import load_cases
+    from reimbursement import calculate_reimbursement
+
+    parser = argparse.ArgumentParser(description="Build the nearest-neighbour residual index.")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--k', type=int, default=DEFAULT_K)
+    parser.add_argument('--output', default=INDEX_PATH)
+    args = parser.parse_args(argv)
+
+    cases = load_cases(args.cases)
+    index = build_index(cases, calculate_reimbursement, args.k)
+    save_index(index, args.output)
+    print(f"Wrote {args.output}: {len(cases)} cases, k={args.k}")
+
+    # Leave-one-out: every case corrected by its neighbours, excluding itself
+    positions = {point: i for i, point in enumerate(index.tree.points)}
+    start = time.perf_counter()
+    before = after = 0.0
+    for days, miles, receipts, expected in cases:
+        amount = calculate_reimbursement(days, miles, receipts)
+        pos = positions[index.normalize(days, miles, receipts)]
+        corrected = amount + index.correction(days, miles, receipts, exclude=pos)
+        before += abs(round(amount, 2) - expected)
+        after += abs(round(corrected, 2) - expected)
+    elapsed = time.perf_counter() - start
+    print(f"Leave-one-out average error: ${before / len(cases):.2f} → ${after / len(cases):.2f} "
+          f"({elapsed / len(cases) * 1e6:.0f} µs per query)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Precomputed (days, miles) table and memo for calculate_reimbursement.
+
+Trip length and mileage are integers in practice, and every part of the
+model except the receipt band depends only on them. lookup_table.bin holds,
+for each (days, miles) pair in the domain, the per diem plus mileage amount
+and the miles-per-day ratio as little-endian float64s. The file is
+memory-mapped, so opening it costs nothing up front and only touched pages
+are read. It records a digest of the rule table and is ignored once
+rules.json changes.
+
+make_model() wraps the table-backed calculation in an LRU memo for repeated
+full triples, as seen with resubmitted claims.
+
+Usage: python3 lookup.py build [--max-days N] [--max-miles N]
+"""
+import mmap
+import os
+import struct
+import sys
+from array import array
+from functools import lru_cache
+
+from reimbursement import (calculate_reimbursement, efficiency_multiplier, mileage_amount,
+                           per_diem_amount, receipt_amount, with_corrections)
+from rules import DEFAULT_RULES, compile_rules, rules_digest
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lookup_table.bin')
+
+MAGIC = b'REIMLUT1'
+# magic, max days, max miles, sha256 of the rule table
+HEADER = struct.Struct('<8sII32s')
+ENTRY = struct.Struct('<dd')
+
+DEFAULT_MEMO_SIZE = 1 << 16
+
+
+def build_table(path=TABLE_PATH, max_days=30, max_miles=2000, rules=DEFAULT_RULES):
+    compiled = compile_rules(rules)
+    values = array('d')
+    for days in range(max_days + 1):
+        base = per_diem_amount(days, compiled)
+        for miles in range(max_miles + 1):
+            values.append(base + mileage_amount(miles, compiled))
+            values.append(miles / days if days > 0 else 0.0)
+    if sys.byteorder != 'little':
+        values.byteswap()
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, max_days, max_miles, bytes.fromhex(rules_digest(rules))))
+        values.tofile(f)
+    os.replace(tmp_path, path)
+
+
+class LookupTable:
+    """Read-only view of lookup_table.bin."""
+
+    def __init__(self, path=TABLE_PATH, rules=DEFAULT_RULES):
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_days, self.max_miles, digest = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a lookup table")
+        if digest.hex() != rules_digest(rules):
+            raise ValueError(f"{path}: built for a different rule table")
+        expected_size = HEADER.size + (self.max_days + 1) * (self.max_miles + 1) * ENTRY.size
+        if len(self._map) != expected_size:
+            raise ValueError(f"{path}: truncated table")
+        self._row = self.max_miles + 1
+        # Zero-copy float64 view of the entries (the table is written little-endian)
+        self._values = memoryview(self._map)[HEADER.size:].cast('d')
+
+    def get(self, days, miles):
+        """Return (per diem + mileage, miles per day), or None outside the table."""
+        d = int(days)
+        m = int(miles)
+        if d != days or m != miles or not (0 <= d <= self.max_days and 0 <= m <= self.max_miles):
+            return None
+        i = (d * self._row + m) * 2
+        values = self._values
+        return values[i], values[i + 1]
+
+    def close(self):
+        self._values.release()
+        self._map.close()
+
+
+def open_table(path=TABLE_PATH, rules=DEFAULT_RULES):
+    """LookupTable for `path`, or None if it is missing or stale."""
+    try:
+        return LookupTable(path, rules)
+    except (OSError, ValueError):
+        return None
+
+
+def make_model(table=None, memo_size=DEFAULT_MEMO_SIZE, rules=DEFAULT_RULES):
+    """Deployed model backed by `table` (if any) and an LRU memo."""
+    compiled = compile_rules(rules)
+
+    if table is None:
+        def model(days, miles, receipts):
+            return calculate_reimbursement(days, miles, receipts, compiled)
+    else:
+        # table.get inlined: this closure is the whole per-request hot path
+        values = table._values
+        row = table._row
+        max_days = table.max_days
+        max_miles = table.max_miles
+
+        def model(days, miles, receipts):
+            d = int(days)
+            m = int(miles)
+            if d != days or m != miles or not (0 <= d <= max_days and 0 <= m <= max_miles):
+                return calculate_reimbursement(days, miles, receipts, compiled)
+            i = (d * row + m) * 2
+            total = values[i] + receipt_amount(receipts, compiled)
+            return total * efficiency_multiplier(days, miles, values[i + 1], receipts, compiled)
+
+    return lru_cache(maxsize=memo_size)(with_corrections(model, compiled))
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build the (days, miles) lookup table.")
+    parser.add_argument('command', choices=['build'])
+    parser.add_argument('--max-days', type=int, default=30)
+    parser.add_argument('--max-miles', type=int, default=2000)
+    parser.add_argument('--output', default=TABLE_PATH)
+    args = parser.parse_args(argv)
+
+    build_table(args.output, args.max_days, args.max_miles)
+    size = os.path.getsize(args.output)
+    print(f"Wrote {args.output}: {args.max_days + 1} x {args.max_miles + 1} entries, {size / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""Stream two reimbursement implementations over a case file and diff them.
+
+Each side is one of:
+  current            the deployed model (rules.json plus its corrections)
+  fixed              the integer fixed-point path (fixed_point.py)
+  rules:FILE         the model under another rules file, e.g. best_rules.json
+  results:FILE       a saved results file, exactly one line per case (private_results.txt)
+  module:function    any calculate_reimbursement-style callable
+
+Cases are read from private_cases.json, or from any archive cases.py can
+stream, in --chunk-size chunks. Both sides score or read each chunk in
+lockstep, so memory is bounded by the chunk size rather than the archive. A
+case changes when the two printed amounts differ. The report gives:
+  - the totals and net change
+  - a histogram of change sizes, split into increases and decreases
+  - per-segment counts by trip length, mileage tier and receipt band
+  - the --show largest changes
+--changes FILE additionally writes every changed case as CSV. The exit
+status is 1 when anything changed, like diff.
+
+Usage: python3 model_diff.py OLD NEW [--cases FILE] [--chunk-size N] [--changes FILE] [--show N]
+"""
+import argparse
+import heapq
+import importlib
+import itertools
+import os
+import sys
+import time
+
+import numpy as np
+
+from cases import iter_cases
+from evaluate import NUMBER_RE
+from explain import band_label
+from reimbursement import format_result
+from rules import DEFAULT_RULES, load_rules
+
+CHUNK_SIZE = 50_000
+# Lower bounds of the change-size buckets in cents; the last bucket is open
+HISTOGRAM_EDGES = (1, 5, 25, 100, 500, 2500, 10000, 50000)
+
+
+class ResultsFile:
+    """Saved results read line by line alongside the cases."""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'r')
+
+    def __call__(self, days, miles, receipts):
+        lines = [line.strip() for line in itertools.islice(self.file, len(days))]
+        if len(lines) < len(days):
+            raise ValueError(f"{self.path} has fewer lines than there are cases")
+        return lines
+
+    def finish(self):
+        """Raise ValueError if lines are left over once every case is read."""
+        if self.file.readline():
+            raise ValueError(f"{self.path} has more lines than there are cases")
+
+    def close(self):
+        self.file.close()
+
+
+def resolve_side(spec):
+    """Chunk scorer for a side spec: fn(days, miles, receipts arrays) -> output strings."""
+    from service import make_batch_model
+
+    if spec.startswith('results:'):
+        return ResultsFile(spec[len('results:'):])
+    if spec in ('current', 'fixed') or spec.startswith('rules:'):
+        rules = load_rules(spec[len('rules:'):]) if spec.startswith('rules:') else DEFAULT_RULES
+        batch = make_batch_model(rules, fixed_point=spec == 'fixed')
+        return lambda days, miles, receipts: [format_result(x) for x in batch(days, miles, receipts).tolist()]
+    module, _, function = spec.partition(':')
+    if not function:
+        raise ValueError(f"Unknown side {spec!r}; use current, fixed, rules:FILE, results:FILE or module:function")
+    model = getattr(importlib.import_module(module), function)
+
+    def score(days, miles, receipts):
+        outputs = []
+        for trip in zip(days.tolist(), miles.tolist(), receipts.tolist()):
+            try:
+                outputs.append(format_result(model(*trip)))
+            except Exception as e:
+                outputs.append(f"ERROR {e}")
+        return outputs
+    return score
+
+
+def to_cents(outputs):
+    """(int64 cents, valid mask) for output strings; invalid lines get 0."""
+    try:
+        values = np.array(outputs, dtype=np.float64)
+    except ValueError:
+        values = None  # an ERROR line somewhere: check line by line
+    if values is not None and np.isfinite(values).all():
+        return np.rint(values * 100).astype(np.int64), np.ones(len(outputs), dtype=bool)
+    cents = np.zeros(len(outputs), dtype=np.int64)
+    valid = np.zeros(len(outputs), dtype=bool)
+    for i, output in enumerate(outputs):
+        if NUMBER_RE.match(output):
+            cents[i] = round(float(output) * 100)
+            valid[i] = True
+    return cents, valid
+
+
+class Segments:
+    """Cases, changed cases, net and largest change per segment value."""
+
+    def __init__(self, size):
+        self.cases = np.zeros(size, dtype=np.int64)
+        self.changed = np.zeros(size, dtype=np.int64)
+        self.net = np.zeros(size, dtype=np.int64)
+        self.largest = np.zeros(size, dtype=np.int64)
+
+    def grow(self, size):
+        if size > len(self.cases):
+            for name in ('cases', 'changed', 'net', 'largest'):
+                values = getattr(self, name)
+                setattr(self, name, np.concatenate([values, np.zeros(size - len(values), dtype=np.int64)]))
+
+    def add(self, index, changed, delta):
+        self.grow(int(index.max()) + 1 if len(index) else 0)
+        size = len(self.cases)
+        self.cases += np.bincount(index, minlength=size)
+        self.changed += np.bincount(index[changed], minlength=size)
+        self.net += np.bincount(index[changed], weights=delta[changed], minlength=size).astype(np.int64)
+        np.maximum.at(self.largest, index[changed], np.abs(delta[changed]))
+
+
+class ModelDiff:
+    def __init__(self, rules=DEFAULT_RULES, show=10):
+        self.show = show
+        self.mileage_breaks = rules['mileage']['breaks']
+        self.receipt_breaks = rules['receipts']['breaks']
+        self.cases = 0
+        self.changed = 0
+        self.errors = 0
+        self.net = 0
+        self.absolute = 0
+        self.histogram = np.zeros((2, len(HISTOGRAM_EDGES)), dtype=np.int64)  # increases, decreases
+        self.segments = {
+            'days': Segments(32),
+            'mileage tier': Segments(len(self.mileage_breaks) + 1),
+            'receipt band': Segments(len(self.receipt_breaks) + 1),
+        }
+        self.largest = []  # min-heap of (|delta|, case, row)
+
+    def add_chunk(self, start, days, miles, receipts, old, new, writer=None):
+        """Fold one chunk of cases numbered start+1.. into the totals."""
+        old_cents, old_valid = to_cents(old)
+        new_cents, new_valid = to_cents(new)
+        differs = np.array(old) != np.array(new)
+        errors = differs & ~(old_valid & new_valid)
+        changed = differs & ~errors
+        delta = np.where(changed, new_cents - old_cents, 0)
+
+        self.cases += len(days)
+        self.changed += int(np.count_nonzero(changed))
+        self.errors += int(np.count_nonzero(errors))
+        self.net += int(delta.sum())
+        self.absolute += int(np.abs(delta).sum())
+
+        bucket = np.searchsorted(HISTOGRAM_EDGES, np.abs(delta[changed]), side='right') - 1
+        self.histogram[0] += np.bincount(bucket[delta[changed] > 0], minlength=self.histogram.shape[1])
+        self.histogram[1] += np.bincount(bucket[delta[changed] < 0], minlength=self.histogram.shape[1])
+
+        day_index = np.clip(np.rint(days), 0, None).astype(np.int64)
+        self.segments['days'].add(day_index, changed, delta)
+        self.segments['mileage tier'].add(np.searchsorted(self.mileage_breaks, miles, side='left'), changed, delta)
+        self.segments['receipt band'].add(np.searchsorted(self.receipt_breaks, receipts, side='right'),
+                                          changed, delta)
+
+        for i in np.flatnonzero(differs).tolist():
+            row = (start + i + 1, days[i], miles[i], receipts[i], old[i], new[i], int(delta[i]))
+            if writer is not None:
+                writer.write(f"{row[0]},{row[1]:g},{row[2]:g},{row[3]:g},{row[4]},{row[5]},"
+                             f"{row[6] / 100:.2f}\n")
+            key = (abs(row[6]) if changed[i] else float('inf'), -row[0])
+            if len(self.largest) < self.show:
+                heapq.heappush(self.largest, (key, row))
+            elif key > self.largest[0][0]:
+                heapq.heapreplace(self.largest, (key, row))
+
+    def segment_label(self, name, index):
+        if name == 'days':
+            return f"{index} day" if index == 1 else f"{index} days"
+        breaks = self.mileage_breaks if name == 'mileage tier' else self.receipt_breaks
+        return band_label(breaks, index, name == 'mileage tier')
+
+    def report(self):
+        lines = [f"🔀 {self.cases:,} cases: {self.changed:,} changed ({self.changed / max(self.cases, 1):.2%}), "
+                 f"{self.errors:,} with an error on one side only, net ${self.net / 100:+,.2f}, "
+                 f"total |change| ${self.absolute / 100:,.2f}"]
+        if not self.changed and not self.errors:
+            return '\n'.join(lines)
+
+        lines.append("")
+        lines.append(f"  {'change size':<22}{'increases':>11}{'decreases':>11}")
+        for b, (lower, upper) in enumerate(zip(HISTOGRAM_EDGES, HISTOGRAM_EDGES[1:] + (None,))):
+            label = f"${lower / 100:,.2f} – ${(upper - 1) / 100:,.2f}" if upper else f"≥ ${lower / 100:,.2f}"
+            up, down = self.histogram[:, b].tolist()
+            if up or down:
+                lines.append(f"  {label:<22}{up:>11,}{down:>11,}")
+
+        for name, segments in self.segments.items():
+            lines.append("")
+            lines.append(f"  {name:<22}{'cases':>11}{'changed':>11}{'net':>14}{'largest':>11}")
+            for index in np.flatnonzero(segments.cases).tolist():
+                lines.append(f"  {self.segment_label(name, index):<22}{segments.cases[index]:>11,}"
+                             f"{segments.changed[index]:>11,}{segments.net[index] / 100:>+14,.2f}"
+                             f"{segments.largest[index] / 100:>11,.2f}")
+
+        lines.append("")
+        lines.append("  Largest changes:")
+        for _, (case, days, miles, receipts, old, new, delta) in sorted(self.largest, reverse=True):
+            change = f"{delta / 100:+.2f}" if NUMBER_RE.match(old) and NUMBER_RE.match(new) else "error"
+            lines.append(f"    case {case}: {days:g}d {miles:g}mi ${receipts:g}: {old} → {new} ({change})")
+        return '\n'.join(lines)
+
+
+def iter_chunks(path, size):
+    """(start, days, miles, receipts) float arrays per chunk of the case file."""
+    cases = iter_cases(path)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(cases, size))
+        if not chunk:
+            return
+        days, miles, receipts = (np.array(column, dtype=np.float64) for column in list(zip(*chunk))[:3])
+        yield start, days, miles, receipts
+        start += len(chunk)
+
+
+def diff(path, old, new, chunk_size=CHUNK_SIZE, writer=None, show=10):
+    """ModelDiff of side specs `old` and `new` over the case file at `path`."""
+    result = ModelDiff(show=show)
+    sides = [resolve_side(old), resolve_side(new)]
+    try:
+        for start, days, miles, receipts in iter_chunks(path, chunk_size):
+            outputs = [side(days, miles, receipts) for side in sides]
+            result.add_chunk(start, days, miles, receipts, *outputs, writer=writer)
+        for side in sides:
+            if isinstance(side, ResultsFile):
+                side.finish()
+    finally:
+        for side in sides:
+            if isinstance(side, ResultsFile):
+                side.close()
+    return result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--cases', default='private_cases.json')
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    parser.add_argument('--changes', default=None, help="write every changed case to this CSV file")
+    parser.add_argument('--show', type=int, default=10, help="largest changes listed")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    writer = None
+    if args.changes:
+        tmp_path = f"{args.changes}.{os.getpid()}.tmp"
+        writer = open(tmp_path, 'w')
+        writer.write("case,days,miles,receipts,old,new,change\n")
+    try:
+        result = diff(args.cases, args.old, args.new, args.chunk_size, writer, args.show)
+    except BaseException as e:
+        if writer is not None:
+            writer.close()
+            os.remove(tmp_path)
+        if isinstance(e, ValueError):
+            sys.exit(f"❌ {e}")
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(tmp_path, args.changes)
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.old} → {args.new} over {args.cases} ({elapsed:.2f}s)")
+    print(result.report())
+    if args.changes:
+        print(f"📄 Changed cases written to {args.changes}")
+    sys.exit(1 if result.changed or result.errors else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Reimbursement model used by run.sh.
+
+Kept importable so evaluation and batch tools can call
+calculate_reimbursement in-process instead of forking run.sh per case.
+"""
+import math
+import sys
+from bisect import bisect_left, bisect_right
+
+from rules import COMPILED_RULES
+
+# Correction stages that rules.json can enable, by name -> module
+CORRECTION_STAGES = {
+    'knn': 'knn_correction',
+    'trees': 'tree_model',  # generated by train_trees.py
+    'clusters': 'cluster_router',
+}
+
+
+# Enhanced approach with efficiency bonuses for high-intensity trips.
+# Every constant comes from rules.json; each band is found with one bisect.
+def per_diem_amount(days, rules=COMPILED_RULES):
+    # Base per diem with penalties for very long trips
+    base_amount = days * rules.per_diem_rates[bisect_left(rules.per_diem_breaks, days)]
+
+    # 5-day bonus
+    if days == rules.bonus_days:
+        base_amount *= rules.bonus_factor
+    return base_amount
+
+
+def mileage_amount(miles, rules=COMPILED_RULES):
+    # Tiered mileage, starting from the precomputed amount of the lower tiers
+    tier = bisect_left(rules.mileage_breaks, miles)
+    return rules.mileage_offsets[tier] + (miles - rules.mileage_lower[tier]) * rules.mileage_rates[tier]
+
+
+def receipt_amount(receipts, rules=COMPILED_RULES):
+    return receipts * rules.receipt_rates[bisect_right(rules.receipt_breaks, receipts)]
+
+
+def efficiency_branch(days, miles, miles_per_day, receipts, rules=COMPILED_RULES):
+    """(branch, multiplier) of the efficiency rule a trip takes.
+
+    Branches are numbered 0 none, 1 one-day, 2 one-day with high receipts and
+    3 + j for efficiency band j; explain.py and result_cache.py use the same
+    numbering.
+    """
+    # EFFICIENCY BONUS - high-intensity trips get multiplicative bonuses
+    if days <= 0:
+        return 0, 1.0
+
+    # Single-day high-mileage trips get special treatment
+    if days == 1 and miles > rules.one_day_miles:
+        multiplier = 1.0 + (miles - rules.one_day_miles) * rules.one_day_slope
+        if receipts > rules.one_day_receipts:  # Additional boost for high receipts
+            return 2, multiplier * rules.one_day_boost
+        return 1, multiplier
+
+    # Multi-day high-intensity trips; first matching band wins
+    for j, (min_miles_per_day, min_receipts, slope) in enumerate(rules.efficiency_bands):
+        if miles_per_day > min_miles_per_day and receipts > min_receipts:
+            return 3 + j, 1.0 + (miles_per_day - min_miles_per_day) * slope
+    return 0, 1.0
+
+
+def efficiency_multiplier(days, miles, miles_per_day, receipts, rules=COMPILED_RULES):
+    return efficiency_branch(days, miles, miles_per_day, receipts, rules)[1]
+
+
+def calculate_reimbursement(days, miles, receipts, rules=COMPILED_RULES):
+    miles_per_day = miles / days if days > 0 else 0.0
+
+    # Combine components and apply efficiency multiplier
+    total = per_diem_amount(days, rules) + mileage_amount(miles, rules) + receipt_amount(receipts, rules)
+    return total * efficiency_multiplier(days, miles, miles_per_day, receipts, rules)
+
+
+def stage_modules(corrections):
+    """[(config, module)] for a list of correction configs."""
+    import importlib
+    modules = []
+    for config in corrections:
+        name = config['stage']
+        if name not in CORRECTION_STAGES:
+            raise ValueError(f"Unknown correction stage: {name}")
+        modules.append((config, importlib.import_module(CORRECTION_STAGES[name])))
+    return modules
+
+
+def load_stages(rules=COMPILED_RULES):
+    """[(name, stage)] for the configured corrections, in order."""
+    return [(config['stage'], module.make_stage(config, rules.raw))
+            for config, module in stage_modules(rules.corrections)]
+
+
+def with_corrections(formula, rules=COMPILED_RULES):
+    """Wrap `formula` with the correction stages listed in rules.json.
+
+    Each stage module provides make_stage(config, rules) returning a callable
+    (days, miles, receipts, amount) -> corrected amount; `rules` is the raw
+    rules dict, so stages built from the formula can check they match it. Modules are only
+    imported when a stage is configured, so the default path stays lean.
+    """
+    if not rules.corrections:
+        return formula
+
+    stages = [stage for _, stage in load_stages(rules)]
+
+    def model(days, miles, receipts):
+        amount = formula(days, miles, receipts)
+        for stage in stages:
+            amount = stage(days, miles, receipts, amount)
+        return amount
+    return model
+
+
+def load_model(rules=COMPILED_RULES):
+    """The deployed model: the formula plus any configured corrections."""
+    if rules is COMPILED_RULES:
+        formula = calculate_reimbursement
+    else:
+        def formula(days, miles, receipts):
+            return calculate_reimbursement(days, miles, receipts, rules)
+    return with_corrections(formula, rules)
+
+
+def load_array_model(rules=None):
+    """The deployed model over NumPy arrays: fn(days, miles, receipts) -> amounts.
+
+    `rules` is a raw rules dict (default rules.json). The formula is
+    vectorized.calculate_reimbursement_array; correction stages run on whole
+    arrays when their module provides make_array_stage(config, rules), otherwise
+    every trip goes through load_model().
+    """
+    import numpy as np
+
+    from rules import DEFAULT_RULES, compile_rules
+    from vectorized import calculate_reimbursement_array
+
+    rules = DEFAULT_RULES if rules is None else rules
+    corrections = rules.get('corrections') or []
+    if not corrections:
+        return lambda days, miles, receipts: calculate_reimbursement_array(days, miles, receipts, rules)
+
+    modules = stage_modules(corrections)
+    if all(hasattr(module, 'make_array_stage') for _, module in modules):
+        stages = [module.make_array_stage(config, rules) for config, module in modules]
+
+        def array_model(days, miles, receipts):
+            amounts = calculate_reimbursement_array(days, miles, receipts, rules)
+            for stage in stages:
+                amounts = stage(days, miles, receipts, amounts)
+            return amounts
+        return array_model
+
+    model = load_model() if rules is DEFAULT_RULES else load_model(compile_rules(rules))
+
+    def scalar_model(days, miles, receipts):
+        trips = zip(np.asarray(days).tolist(), np.asarray(miles).tolist(), np.asarray(receipts).tolist())
+        return np.array([model(d, m, r) for d, m, r in trips], dtype=np.float64)
+    return scalar_model
+
+
+def format_result(result):
+    return f"{result:.2f}"
+
+
+def check_inputs(days, miles, receipts):
+    """Return the inputs, or raise ValueError naming any that is NaN or infinite."""
+    for name, value in (('days', days), ('miles', miles), ('receipts', receipts)):
+        if not math.isfinite(value):
+            raise ValueError(f"{name} must be a finite number, got {value}")
+    return days, miles, receipts
+
+
+def parse_request(line):
+    """Parse one --serve request into (days, miles, receipts).
+
+    Accepts either whitespace-separated `days miles receipts` or a JSON
+    object using the private_cases.json field names.
+    """
+    line = line.strip()
+    if line.startswith('{'):
+        import json
+        record = json.loads(line)
+        return check_inputs(float(record['trip_duration_days']),
+                            float(record['miles_traveled']),
+                            float(record['total_receipts_amount']))
+    fields = line.split()
+    if len(fields) != 3:
+        raise ValueError(f"expected 3 fields, got {len(fields)}")
+    return check_inputs(float(fields[0]), float(fields[1]), float(fields[2]))
+
+
+def serve(stdin, stdout, stderr, model=calculate_reimbursement):
+    """Answer newline-delimited requests from one warm interpreter.
+
+    Each non-blank input line produces exactly one output line: the
+    formatted reimbursement, or ERROR with a diagnostic on stderr.
+    """
+    write = stdout.write
+    flush = stdout.flush
+    for lineno, line in enumerate(stdin, start=1):
+        if not line.strip():
+            continue
+        try:
+            days, miles, receipts = parse_request(line)
+            output = format_result(model(days, miles, receipts))
+        except Exception as e:
+            print(f"Error on line {lineno}: {e}", file=stderr)
+            output = "ERROR"
+        write(output + "\n")
+        flush()
+
+
+def main(argv):
+    if argv == ['--serve']:
+        # Long-lived mode: use the (days, miles) table if built, plus a memo
+        import lookup
+        serve(sys.stdin, sys.stdout, sys.stderr, lookup.make_model(lookup.open_table()))
+        return
+    if argv[:1] == ['--explain']:
+        import explain
+        explain.main(argv[1:])
+        return
+
+    if len(argv) != 3:
+        sys.exit("Usage: run.sh <trip_duration_days> <miles_traveled> <total_receipts_amount>\n"
+                 "       run.sh --serve   (read 'days miles receipts' lines from stdin)\n"
+                 "       run.sh --explain <days> <miles> <receipts>")
+
+    try:
+        days = float(argv[0])
+        miles = float(argv[1])
+        receipts = float(argv[2])
+        check_inputs(days, miles, receipts)
+    except ValueError as e:
+        sys.exit(f"Invalid input: {e}")
+
+    result = load_model()(days, miles, receipts)
+    print(format_result(result))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""Content-addressed cache of per-case model outputs.
+
+Each case's key hashes three things:
+  - the model code: the AST of reimbursement.py and rules.py, so comment and
+    formatting edits do not count, plus run.sh and, when corrections are
+    configured, their settings, stage modules and saved indexes
+  - the slice of rules.json the case actually reads: the rate and bounds of
+    its per diem band, the mileage tiers up to its own, its receipt band,
+    the bonus settings and the efficiency branches it tests
+  - the input triple
+A rule change therefore only misses the cases whose bands use that rule, and
+every other result is reused.
+
+Entries live in a SQLite file (WAL mode, so concurrent runs can read and
+write it). It holds at most MAX_ENTRIES results; the least recently used
+are evicted first.
+
+Hashing and looking up a case costs more than scoring it with the formula
+or the vectorized clusters stage, so evaluate.py and generate_results.py
+only use the cache with --cache. It pays off for slow per-case stages such
+as knn.
+
+Usage: python3 result_cache.py [--cache FILE] stats | clear
+"""
+import ast
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from bisect import bisect_left, bisect_right
+
+from reimbursement import CORRECTION_STAGES, efficiency_branch
+from rules import compile_rules
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CACHE_PATH = os.path.join(HERE, 'results_cache.sqlite')
+MODEL_SOURCES = ('reimbursement.py', 'rules.py')
+MAX_ENTRIES = 500_000
+# Keys per SELECT ... IN (...) query, below SQLite's parameter limit
+QUERY_BATCH = 500
+# Hits refresh their eviction timestamp at most this often
+RECENCY_NS = 3600 * 10 ** 9
+
+
+def normalized_source(path):
+    """Source of `path` with comments and formatting stripped."""
+    with open(path, 'r') as f:
+        source = f.read()
+    try:
+        return ast.dump(ast.parse(source)).encode()
+    except SyntaxError:
+        return source.encode()
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.digest()
+
+
+def model_hash(rules):
+    """Digest of everything except rules.json that decides outputs."""
+    h = hashlib.sha256()
+    for name in MODEL_SOURCES:
+        h.update(normalized_source(os.path.join(HERE, name)))
+    h.update(file_digest(os.path.join(HERE, 'run.sh')))
+
+    corrections = rules.get('corrections') or []
+    if corrections:
+        import importlib
+
+        h.update(json.dumps(corrections, sort_keys=True).encode())
+        for config in corrections:
+            module = CORRECTION_STAGES.get(config['stage'], config['stage'])
+            h.update(normalized_source(os.path.join(HERE, module + '.py')))
+            # Stages with a saved index (knn, clusters) name it INDEX_PATH
+            index = config.get('index', getattr(importlib.import_module(module), 'INDEX_PATH', None))
+            if index:
+                h.update(file_digest(index))
+    return h.digest()
+
+
+def _bounds(breaks, band):
+    return [breaks[band - 1] if band > 0 else None, breaks[band] if band < len(breaks) else None]
+
+
+def bands(days, miles, receipts, rules):
+    """(per diem band, bonus applies, mileage tier, receipt band, efficiency branch, 1-day trip).
+
+    Same bisects as reimbursement.py; the efficiency branch comes from
+    reimbursement.efficiency_branch (0 none, 1-2 one-day, 3+ band).
+    """
+    miles_per_day = miles / days if days > 0 else 0.0
+    branch, _ = efficiency_branch(days, miles, miles_per_day, receipts, rules)
+    return (bisect_left(rules.per_diem_breaks, days), days == rules.bonus_days,
+            bisect_left(rules.mileage_breaks, miles), bisect_right(rules.receipt_breaks, receipts),
+            branch, days == 1)
+
+
+def rule_slice(rules, per_diem, bonus, tier, receipt_band, branch, one_day):
+    """The parts of raw `rules` a case in these bands reads."""
+    efficiency = rules['efficiency']
+    used = {
+        'per_diem': [rules['per_diem']['rates'][per_diem], _bounds(rules['per_diem']['breaks'], per_diem)],
+        'bonus_days': rules['five_day_bonus']['days'],
+        'mileage': [rules['mileage']['rates'][:tier + 1], rules['mileage']['breaks'][:tier + 1]],
+        'receipts': [rules['receipts']['rates'][receipt_band], _bounds(rules['receipts']['breaks'], receipt_band)],
+    }
+    if bonus:
+        used['bonus_factor'] = rules['five_day_bonus']['factor']
+    if one_day:
+        # 1-day trips test min_miles first; the rest only matters if taken
+        used['one_day'] = efficiency['one_day'] if branch in (1, 2) else efficiency['one_day']['min_miles']
+    if branch not in (1, 2):
+        # Bands are tried in order: the matched one and every one before it
+        used['bands'] = efficiency['bands'][:branch - 2] if branch >= 3 else efficiency['bands']
+    return json.dumps(used, sort_keys=True).encode()
+
+
+def case_keys(cases, rules):
+    """16-byte cache key per (days, miles, receipts, ...) case under raw `rules`."""
+    compiled = compile_rules(rules)
+    base = model_hash(rules)
+    slices = {}
+    keys = []
+    for case in cases:
+        days, miles, receipts = case[:3]
+        row = bands(days, miles, receipts, compiled)
+        if row not in slices:
+            slices[row] = hashlib.sha256(base + rule_slice(rules, *row)).digest()
+        triple = f"{days!r} {miles!r} {receipts!r}".encode()
+        keys.append(hashlib.sha256(slices[row] + triple).digest()[:16])
+    return keys
+
+
+class ResultCache:
+    def __init__(self, path=CACHE_PATH, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.db = sqlite3.connect(path, timeout=60)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS results '
+                            '(key BLOB PRIMARY KEY, output TEXT NOT NULL, used INTEGER NOT NULL) WITHOUT ROWID')
+            self.db.execute('CREATE INDEX IF NOT EXISTS results_used ON results (used)')
+
+    def get_many(self, keys):
+        """{key: output} for the keys present; marks them recently used."""
+        found = {}
+        stale = []
+        now = time.time_ns()
+        unique = list(set(keys))
+        for i in range(0, len(unique), QUERY_BATCH):
+            batch = unique[i:i + QUERY_BATCH]
+            query = f"SELECT key, output, used FROM results WHERE key IN ({','.join('?' * len(batch))})"
+            for key, output, used in self.db.execute(query, batch):
+                found[key] = output
+                if used < now - RECENCY_NS:
+                    stale.append((now, key))
+        if stale:
+            with self.db:
+                self.db.executemany('UPDATE results SET used = ? WHERE key = ?', stale)
+        return found
+
+    def put_many(self, items):
+        """Store (key, output) pairs, then evict beyond max_entries."""
+        now = time.time_ns()
+        with self.db:
+            self.db.executemany('INSERT OR REPLACE INTO results (key, output, used) VALUES (?, ?, ?)',
+                                [(key, output, now) for key, output in items])
+            excess = self.count() - self.max_entries
+            if excess > 0:
+                self.db.execute('DELETE FROM results WHERE key IN '
+                                '(SELECT key FROM results ORDER BY used LIMIT ?)', (excess,))
+
+    def count(self):
+        return self.db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def clear(self):
+        with self.db:
+            self.db.execute('DELETE FROM results')
+
+    def close(self):
+        self.db.close()
+
+
+def cached_outputs(cases, rules, compute, cache):
+    """Output string per case, computing only cache misses.
+
+    compute(indices) returns an output string (or None on failure) for each
+    index; failures are not cached. Returns (outputs, hits).
+    """
+    keys = case_keys(cases, rules)
+    stored = cache.get_many(keys)
+    outputs = [stored.get(key) for key in keys]
+    missing = [i for i, output in enumerate(outputs) if output is None]
+    if missing:
+        for i, output in zip(missing, compute(missing)):
+            outputs[i] = output
+        cache.put_many({keys[i]: outputs[i] for i in missing if outputs[i] is not None}.items())
+    return outputs, len(cases) - len(missing)
+
+
+def write_atomic(path, lines):
+    """Write lines to `path` via a temporary file and rename."""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.writelines(line + "\n" for line in lines)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def main(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=['stats', 'clear'])
+    parser.add_argument('--cache', default=CACHE_PATH)
+    args = parser.parse_args(argv)
+
+    cache = ResultCache(args.cache)
+    if args.command == 'clear':
+        cache.clear()
+    size = os.path.getsize(args.cache) if os.path.exists(args.cache) else 0
+    print(f"{args.cache}: {cache.count():,} entries, {size / 1e6:.1f} MB")
+    cache.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
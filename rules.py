@@ -0,0 +1,146 @@
+"""Rule table for the reimbursement model.
+
+The constants live in rules.json so a tuned rule set (see calibrate.py) can
+be deployed without editing code. Band `breaks` are ascending thresholds;
+`rates` has one more entry than `breaks`, the last rate applying beyond the
+final threshold. Per diem and mileage bands are inclusive
+(`value <= break`), receipt bands exclusive (`value < break`), matching the
+original if/elif chains.
+
+`efficiency.one_day` is checked before `efficiency.bands`; among the bands
+the first match wins, and a `min_receipts` of null means no receipt
+condition.
+
+`corrections` lists optional stages applied after the formula, in order,
+each an object naming its `stage` plus stage-specific settings (see
+reimbursement.load_model). Artifacts derived from the formula are keyed on
+rules_digest, which ignores this list.
+
+compile_rules turns the table into sorted tuples with the cumulative
+mileage amount at the start of each tier precomputed, so the scalar model
+finds every band with a single bisect.
+
+Importing json (and re behind it) would double run.sh's cold start, so the
+parsed rules.json is kept in a marshal cache next to it, tagged with the
+source's mtime and size. json is only imported when rules.json has changed
+since the cache was written.
+"""
+import marshal
+import os
+
+RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+CACHE_PATH = RULES_PATH + '.cache'
+
+
+def load_rules(path=RULES_PATH):
+    import json
+
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_default_rules(path=RULES_PATH, cache_path=CACHE_PATH):
+    """rules.json via the marshal cache, refreshing the cache when stale."""
+    st = os.stat(path)
+    stamp = (st.st_mtime_ns, st.st_size)
+    try:
+        with open(cache_path, 'rb') as f:
+            cached_stamp, rules = marshal.load(f)
+        if cached_stamp == stamp:
+            return rules
+    except (OSError, EOFError, ValueError, TypeError):
+        pass
+    rules = load_rules(path)
+    try:
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            marshal.dump((stamp, rules), f)
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass  # read-only checkout: parse the JSON every time
+    return rules
+
+
+def dump_rules(rules, f):
+    """Write `rules` in the rules.json layout (one line per number list)."""
+    import json
+    import re
+
+    text = json.dumps(rules, indent=2)
+    text = re.sub(r'\[\s+([^\[\]{}]*?)\s+\]',
+                  lambda m: '[' + re.sub(r',\s+', ', ', m.group(1)) + ']', text)
+    f.write(text + "\n")
+
+
+def rules_digest(rules):
+    """Stable hash of the formula rules, for invalidating derived artifacts."""
+    import hashlib  # not needed on the run.sh startup path
+    import json
+    formula = {key: value for key, value in rules.items() if key != 'corrections'}
+    canonical = json.dumps(formula, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def tier_offsets(breaks, rates):
+    """Lower bound and accumulated amount at the start of each tier."""
+    lower = [0]
+    offsets = [0.0]
+    for i, upper in enumerate(breaks):
+        offsets.append(offsets[-1] + (upper - lower[-1]) * rates[i])
+        lower.append(upper)
+    return lower, offsets
+
+
+def _check_bands(name, bands):
+    breaks = bands['breaks']
+    if len(bands['rates']) != len(breaks) + 1:
+        raise ValueError(f"{name}: expected {len(breaks) + 1} rates, got {len(bands['rates'])}")
+    if any(a >= b for a, b in zip(breaks, breaks[1:])):
+        raise ValueError(f"{name}: breaks must be strictly ascending: {breaks}")
+    return tuple(breaks), tuple(float(r) for r in bands['rates'])
+
+
+class CompiledRules:
+    """Rule table flattened into tuples for bisect lookups."""
+
+    __slots__ = (
+        'per_diem_breaks', 'per_diem_rates', 'bonus_days', 'bonus_factor',
+        'mileage_breaks', 'mileage_rates', 'mileage_lower', 'mileage_offsets',
+        'receipt_breaks', 'receipt_rates',
+        'one_day_miles', 'one_day_slope', 'one_day_receipts', 'one_day_boost',
+        'efficiency_bands', 'corrections', 'raw',
+    )
+
+    def __init__(self, rules):
+        self.raw = rules
+        self.per_diem_breaks, self.per_diem_rates = _check_bands('per_diem', rules['per_diem'])
+        self.bonus_days = rules['five_day_bonus']['days']
+        self.bonus_factor = rules['five_day_bonus']['factor']
+
+        self.mileage_breaks, self.mileage_rates = _check_bands('mileage', rules['mileage'])
+        lower, offsets = tier_offsets(self.mileage_breaks, self.mileage_rates)
+        self.mileage_lower = tuple(lower)
+        self.mileage_offsets = tuple(offsets)
+
+        self.receipt_breaks, self.receipt_rates = _check_bands('receipts', rules['receipts'])
+
+        one_day = rules['efficiency']['one_day']
+        self.one_day_miles = one_day['min_miles']
+        self.one_day_slope = one_day['slope']
+        self.one_day_receipts = one_day['receipt_threshold']
+        self.one_day_boost = one_day['receipt_boost']
+        self.efficiency_bands = tuple(
+            (band['min_miles_per_day'],
+             float('-inf') if band['min_receipts'] is None else band['min_receipts'],
+             band['slope'])
+            for band in rules['efficiency']['bands']
+        )
+        self.corrections = tuple(rules.get('corrections', ()))
+
+
+def compile_rules(rules):
+    return CompiledRules(rules)
+
+
+DEFAULT_RULES = load_default_rules()
+COMPILED_RULES = compile_rules(DEFAULT_RULES)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""Fast approximate evaluation from a stratified sample of the public cases.
+
+Cases are stratified by per diem band, miles-per-day band (cut at the
+efficiency thresholds) and receipt band, and sampled in proportion to
+stratum size. Metrics are the eval.sh ones, estimated as stratum-weighted
+means and projected to the full case count. Each comes with a stratified
+bootstrap confidence interval.
+
+compare() ranks two candidate rule sets on the same sample by their paired
+score difference. When the interval of that difference includes zero, the
+sample cannot separate them: it is doubled until it can, and past
+--max-fraction of the cases both candidates get a full evaluation.
+
+Resampling costs too: when the case file is small enough that one
+vectorized pass over every case is cheaper than the bootstrap (the public
+cases are), estimate() and compare() simply evaluate everything.
+
+Usage: python3 sampled_eval.py [--sample N] [--bootstrap B] [--confidence PCT]
+                               [--seed N] [--max-fraction F] [--candidate RULES.json]
+"""
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from case_store import CaseColumns, open_store
+from error_analytics import score_cases
+from evaluate import CLOSE_ERROR, EXACT_ERROR, eval_score
+from rules import DEFAULT_RULES
+
+# Scoring one case in a full vectorized pass costs about as much as this many
+# bootstrap draws (measured with the bare formula; correction stages only
+# make the full pass dearer)
+DRAWS_PER_CASE = 10
+
+
+def case_metrics(error, num_cases):
+    """Per-case columns whose means are the eval.sh metrics.
+
+    score = 100 * average error + 0.1 * (cases - exact), which is the mean
+    of 100 * error + 0.1 * cases * (not exact) over the cases.
+    """
+    exact = error < EXACT_ERROR
+    return {
+        'avg_error': error,
+        'exact_pct': exact * 100.0,
+        'close_pct': (error < CLOSE_ERROR) * 100.0,
+        # eval_score of one case, counted as num_cases exact matches or none
+        'score': eval_score(error, num_cases, num_cases * exact),
+    }
+
+
+def stratify(days, miles, receipts, rules=DEFAULT_RULES):
+    """Stratum number per case: per diem band x miles-per-day band x receipt band.
+
+    Miles per day is cut at the efficiency thresholds, so every stratum is
+    one region of the rules.
+    """
+    days = np.asarray(days, dtype=np.float64)
+    miles_per_day = np.asarray(miles, dtype=np.float64) / np.where(days > 0, days, 1.0)
+    thresholds = sorted(band['min_miles_per_day'] for band in rules['efficiency']['bands'])
+    keys = [
+        (np.searchsorted(rules['per_diem']['breaks'], days, side='left'), len(rules['per_diem']['breaks']) + 1),
+        (np.searchsorted(thresholds, miles_per_day, side='left'), len(thresholds) + 1),
+        (np.searchsorted(rules['receipts']['breaks'], receipts, side='right'), len(rules['receipts']['breaks']) + 1),
+    ]
+    strata = np.zeros(len(days), dtype=np.int64)
+    for index, size in keys:
+        strata = strata * size + index
+    return np.unique(strata, return_inverse=True)[1].reshape(-1)
+
+
+class StratifiedSample:
+    """A proportional stratified sample of row indices with stratum weights."""
+
+    def __init__(self, strata, size, rng):
+        counts = np.bincount(strata)
+        present = np.flatnonzero(counts)
+        shares = counts[present] * size / len(strata)
+        # Largest-remainder allocation, at least two cases per stratum so each
+        # contributes bootstrap variance
+        allocation = np.maximum(np.floor(shares).astype(np.int64), 2)
+        shortfall = size - allocation.sum()
+        if shortfall > 0:
+            allocation[np.argsort(-(shares - np.floor(shares)), kind='stable')[:shortfall]] += 1
+        allocation = np.minimum(allocation, counts[present])
+
+        self.groups = []  # (weight, positions into self.rows)
+        rows = []
+        for stratum, n in zip(present.tolist(), allocation.tolist()):
+            members = np.flatnonzero(strata == stratum)
+            chosen = rng.choice(members, size=n, replace=False)
+            self.groups.append((counts[stratum] / len(strata), np.arange(len(rows), len(rows) + n)))
+            rows.extend(chosen.tolist())
+        self.rows = np.array(rows, dtype=np.int64)
+        # Per sampled case: its stratum weight over the stratum's sample size
+        self.case_weight = np.concatenate([np.full(len(positions), weight / len(positions))
+                                           for weight, positions in self.groups])
+
+        # Bootstrap layout: each stratum draws n - 1 of its n cases (one if it
+        # has a single case). Per draw column: its stratum's first position,
+        # its stratum's size, and weight / draws so a replicate's weighted mean
+        # is one dot product.
+        draws = [max(len(positions) - 1, 1) for _, positions in self.groups]
+        self.draw_start = np.repeat([positions[0] for _, positions in self.groups], draws)
+        self.draw_size = np.repeat([len(positions) for _, positions in self.groups], draws)
+        self.draw_weight = np.repeat([weight / d for (weight, _), d in zip(self.groups, draws)], draws)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def mean(self, values):
+        """Stratum-weighted mean of `values` (one per sampled case, or rows of them)."""
+        return np.asarray(values) @ self.case_weight
+
+    def bootstrap_means(self, values, replicates, rng):
+        """Stratified bootstrap replicates of the weighted mean of `values`.
+
+        `values` is one column per sampled case, or a (metrics, cases) array
+        whose rows share the same resamples. Each replicate draws n - 1 of a
+        stratum's n cases, which keeps the replicate variance unbiased for the
+        few cases a stratum holds. All strata are drawn in one call.
+        """
+        # Scaling uniform floats is several times faster than integers() with a
+        # per-column bound
+        picks = self.draw_start + (rng.random((replicates, len(self.draw_size))) * self.draw_size).astype(np.int64)
+        return np.take(values, picks, axis=-1) @ self.draw_weight
+
+
+class SampledEvaluator:
+    def __init__(self, columns, sample_size=200, replicates=1000, confidence=95.0, seed=0,
+                 max_fraction=0.5):
+        self.columns = CaseColumns(*(np.asarray(column) for column in columns))
+        self.num_cases = len(self.columns.days)
+        self.replicates = replicates
+        self.confidence = confidence
+        self.max_fraction = max_fraction
+        self.rng = np.random.default_rng(seed)
+
+        self.strata = stratify(self.columns.days, self.columns.miles, self.columns.receipts)
+        self.sample = self.draw(sample_size)
+
+    def draw(self, size):
+        return StratifiedSample(self.strata, min(size, self.num_cases), self.rng)
+
+    def errors(self, rules, rows=None):
+        columns = self.columns if rows is None else CaseColumns(*(column[rows] for column in self.columns))
+        return score_cases(columns, rules)['error']
+
+    def interval(self, replicates):
+        """(low, high) of the replicates along their last axis."""
+        tail = (100 - self.confidence) / 2
+        return np.percentile(replicates, [tail, 100 - tail], axis=-1)
+
+    def full_is_cheaper(self, sample=None):
+        """Whether scoring every case costs less than bootstrapping `sample`."""
+        sample = sample or self.sample
+        return self.num_cases * DRAWS_PER_CASE <= self.replicates * len(sample)
+
+    def estimate(self, rules=DEFAULT_RULES, sample=None):
+        """{metric: (estimate, low, high)} from the sample.
+
+        When a full evaluation is cheaper, every case is scored and each
+        interval collapses to the exact value.
+        """
+        sample = sample or self.sample
+        if self.full_is_cheaper(sample):
+            return {name: (value, value, value) for name, value in self.full(rules).items()}
+        per_case = case_metrics(self.errors(rules, sample.rows), self.num_cases)
+        # One set of resamples shared by all metrics
+        values = np.array(list(per_case.values()))
+        low, high = self.interval(sample.bootstrap_means(values, self.replicates, self.rng))
+        means = sample.mean(values)
+        return {name: (means[i], low[i], high[i]) for i, name in enumerate(per_case)}
+
+    def full(self, rules=DEFAULT_RULES):
+        return {name: values.mean() for name, values in case_metrics(self.errors(rules), self.num_cases).items()}
+
+    def compare(self, rules_a, rules_b):
+        """Rank two rule sets by score, escalating until they separate.
+
+        Returns a dict with `winner` ('a', 'b' or 'tie'), the score
+        difference b - a with its interval (None after a full evaluation),
+        and how many cases were scored per candidate.
+        """
+        sample = self.sample
+        while len(sample) <= self.max_fraction * self.num_cases and not self.full_is_cheaper(sample):
+            # Paired: both candidates scored on the same cases
+            diff = (case_metrics(self.errors(rules_b, sample.rows), self.num_cases)['score']
+                    - case_metrics(self.errors(rules_a, sample.rows), self.num_cases)['score'])
+            delta = sample.mean(diff)
+            low, high = self.interval(sample.bootstrap_means(diff, self.replicates, self.rng))
+            if low > 0 or high < 0:
+                return {'winner': 'a' if low > 0 else 'b', 'score_delta': delta,
+                        'interval': (low, high), 'cases': len(sample)}
+            sample = self.draw(len(sample) * 2)
+
+        delta = self.full(rules_b)['score'] - self.full(rules_a)['score']
+        winner = 'tie' if delta == 0 else ('a' if delta > 0 else 'b')
+        return {'winner': winner, 'score_delta': delta, 'interval': None, 'cases': self.num_cases}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--sample', type=int, default=200)
+    parser.add_argument('--bootstrap', type=int, default=1000, help="bootstrap replicates")
+    parser.add_argument('--confidence', type=float, default=95.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-fraction', type=float, default=0.5,
+                        help="largest sample share before comparisons fall back to a full evaluation")
+    parser.add_argument('--candidate', help="rules file to compare against rules.json")
+    args = parser.parse_args(argv)
+
+    evaluator = SampledEvaluator(open_store(args.cases), args.sample, args.bootstrap, args.confidence,
+                                 args.seed, args.max_fraction)
+    start = time.perf_counter()
+    estimate = evaluator.estimate()
+    elapsed = time.perf_counter() - start
+
+    if evaluator.full_is_cheaper():
+        print(f"📊 Full evaluation of {evaluator.num_cases} cases, cheaper than bootstrapping a "
+              f"{len(evaluator.sample)} case sample ({elapsed * 1000:.1f} ms):")
+    else:
+        print(f"📊 Estimate from {len(evaluator.sample)} of {evaluator.num_cases} cases "
+              f"({args.confidence:g}% bootstrap intervals, {elapsed * 1000:.1f} ms):")
+    full = evaluator.full()
+    for name in estimate:
+        value, low, high = estimate[name]
+        print(f"  {name:<10}{value:>10.2f}   [{low:.2f}, {high:.2f}]   full: {full[name]:.2f}")
+
+    if args.candidate:
+        with open(args.candidate, 'r') as f:
+            candidate = json.load(f)
+        result = evaluator.compare(DEFAULT_RULES, candidate)
+        names = {'a': 'rules.json', 'b': args.candidate, 'tie': 'neither'}
+        how = (f"interval [{result['interval'][0]:.1f}, {result['interval'][1]:.1f}]"
+               if result['interval'] else "full evaluation")
+        print(f"\n🎯 Better: {names[result['winner']]} (score change {result['score_delta']:+.1f}, "
+              f"{how}, {result['cases']} cases)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
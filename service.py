@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Asyncio reimbursement service with micro-batched vectorized evaluation.
+
+Speaks JSON lines over TCP or a Unix socket. Each request line is either
+`days miles receipts` or a JSON object with the private_cases.json field
+names (as in `run.sh --serve`); the reply line is the `:.2f` amount, or
+`ERROR <reason>`. Replies on a connection come back in request order, so
+clients may pipeline. The line `stats` returns a JSON snapshot instead:
+queue depth, request/error/timeout counts, the batch size histogram and
+latency percentiles.
+
+Requests from all connections go through one bounded queue. The batcher
+takes up to --batch-size requests, waiting at most --window ms after the
+first, and scores them in one calculate_reimbursement_array call (bit-for-bit
+the scalar formula). When the queue is full, connections stop being read
+until it drains, which pushes back on clients through TCP flow control.
+Requests not answered within --timeout seconds get `ERROR timeout`.
+
+Batches go through reimbursement.load_array_model, so configured correction
+stages apply: on the whole batch when every stage module provides
+make_array_stage (cluster_router does), otherwise trip by trip. --fixed-point
+scores the formula with fixed_point.calculate_cents_array.
+
+Usage: python3 service.py [--host H] [--port N | --unix PATH] [--batch-size N]
+                          [--window MS] [--queue N] [--timeout S] [--fixed-point]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter, deque
+
+import numpy as np
+
+from benchmark import percentile
+from reimbursement import format_result, load_array_model, parse_request
+from rules import DEFAULT_RULES
+
+LATENCY_SAMPLES = 10000
+
+
+def make_batch_model(rules=DEFAULT_RULES, fixed_point=False):
+    """fn(days, miles, receipts arrays) -> amounts for one batch."""
+    if fixed_point:
+        from fixed_point import FixedRules, calculate_cents_array
+
+        fixed = FixedRules(rules)
+        return lambda days, miles, receipts: calculate_cents_array(days, miles, receipts, fixed) / 100
+    return load_array_model(rules)
+
+
+class Stats:
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.batch_sizes = Counter()  # power-of-two bucket -> batches
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+
+    def record_batch(self, size):
+        self.batches += 1
+        bucket = 1
+        while bucket < size:
+            bucket *= 2
+        self.batch_sizes[bucket] += 1
+
+    def snapshot(self, queue_depth):
+        latencies = list(self.latencies)
+        snapshot = {
+            'queue_depth': queue_depth,
+            'requests': self.requests,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'batches': self.batches,
+            'batch_size_histogram': {f"<={size}": n for size, n in sorted(self.batch_sizes.items())},
+        }
+        if latencies:
+            snapshot['latency_ms'] = {f"p{pct}": round(percentile(latencies, pct) * 1000, 3)
+                                      for pct in (50, 95, 99)}
+        return snapshot
+
+
+class BatchingService:
+    def __init__(self, batch_size=512, window=0.002, queue_size=10000, timeout=5.0, rules=DEFAULT_RULES,
+                 fixed_point=False):
+        self.batch_size = batch_size
+        self.window = window
+        self.timeout = timeout
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.score = make_batch_model(rules, fixed_point)
+        self.stats = Stats()
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Drop requests whose callers already timed out
+            batch = [(triple, future) for triple, future in batch if not future.done()]
+            if not batch:
+                continue
+            self.stats.record_batch(len(batch))
+            columns = np.array([triple for triple, _ in batch], dtype=np.float64)
+            try:
+                amounts = self.score(columns[:, 0], columns[:, 1], columns[:, 2]).tolist()
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), amount in zip(batch, amounts):
+                future.set_result(amount)
+
+    async def submit(self, triple):
+        """Queue one request and wait for its amount (or raise TimeoutError)."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((triple, future))
+        return await future
+
+    async def answer(self, line):
+        start = time.perf_counter()
+        self.stats.requests += 1
+        try:
+            triple = parse_request(line)
+            output = format_result(await asyncio.wait_for(self.submit(triple), self.timeout))
+        except asyncio.TimeoutError:
+            self.stats.timeouts += 1
+            output = "ERROR timeout"
+        except Exception as e:
+            self.stats.errors += 1
+            output = f"ERROR {e}"
+        self.stats.latencies.append(time.perf_counter() - start)
+        return output
+
+    async def handle(self, reader, writer):
+        # One task per request so a pipelining client fills whole batches;
+        # the writer drains their results in request order.
+        pending = asyncio.Queue(maxsize=self.batch_size)
+
+        async def write_replies():
+            while True:
+                reply = await pending.get()
+                if reply is None:
+                    break
+                if reply == 'stats':
+                    # Snapshot once the requests ahead of it are answered
+                    text = json.dumps(self.stats.snapshot(self.queue.qsize()))
+                else:
+                    text = await reply
+                writer.write((text + "\n").encode())
+                await writer.drain()
+
+        replier = asyncio.create_task(write_replies())
+
+        async def enqueue(item):
+            """Queue `item` for the replier; False once the replier has stopped."""
+            if not pending.full():
+                pending.put_nowait(item)
+                return True
+            # Wait for room, unless the replier dies (e.g. the client reset the
+            # connection mid-drain) and nothing will ever make room
+            put = asyncio.ensure_future(pending.put(item))
+            await asyncio.wait({put, replier}, return_when=asyncio.FIRST_COMPLETED)
+            if put.done():
+                return True
+            put.cancel()
+            if isinstance(item, asyncio.Future):
+                item.cancel()
+            return False
+
+        try:
+            while not replier.done():
+                line = await reader.readline()
+                if not line:
+                    if await enqueue(None):
+                        await replier
+                    break
+                line = line.decode().strip()
+                if not line:
+                    continue
+                if line == 'stats':
+                    queued = await enqueue('stats')
+                else:
+                    queued = await enqueue(asyncio.ensure_future(self.answer(line)))
+                if not queued:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            replier.cancel()
+            while not pending.empty():
+                reply = pending.get_nowait()
+                if isinstance(reply, asyncio.Future):
+                    reply.cancel()
+            # Retrieves a reset raised while draining, so it is not logged as unhandled
+            await asyncio.gather(replier, return_exceptions=True)
+            writer.close()
+
+
+async def serve(args):
+    service = BatchingService(args.batch_size, args.window / 1000, args.queue, args.timeout,
+                              fixed_point=args.fixed_point)
+    batcher = asyncio.create_task(service.run_batches())
+    if args.unix:
+        server = await asyncio.start_unix_server(service.handle, path=args.unix)
+        where = args.unix
+    else:
+        server = await asyncio.start_server(service.handle, args.host, args.port)
+        where = f"{args.host}:{args.port}"
+    print(f"Listening on {where} (batch ≤{args.batch_size}, window {args.window:g} ms)", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+    batcher.cancel()
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="listen on this Unix socket path instead of TCP")
+    parser.add_argument('--batch-size', type=int, default=512, help="maximum requests per batch")
+    parser.add_argument('--window', type=float, default=2.0, help="batch collection window in ms")
+    parser.add_argument('--queue', type=int, default=10000, help="queued requests before backpressure")
+    parser.add_argument('--timeout', type=float, default=5.0, help="per-request timeout in seconds")
+    parser.add_argument('--fixed-point', action='store_true', help="score with the integer-cents path")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
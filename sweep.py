@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""Map the model's cliffs by sweeping a dense (days, miles, receipts) grid.
+
+The default grid is days 1-30, miles 0-2,000 in whole miles and receipts
+$0-$3,000 in cents: about 18 billion trips. It is scored in fixed-size
+chunks with calculate_reimbursement_array: a block of miles rows by the full
+receipts row, for one trip length at a time. Memory therefore stays at a few
+chunks per worker no matter how large the grid is.
+
+Each chunk is compared with its neighbours one grid step away along every
+axis:
+  receipts, miles   a change larger than --threshold is a discontinuity
+                    (reported as a jump, or as non-monotonic if it drops)
+  days              a drop larger than --threshold when the trip gets one
+                    day longer is non-monotonic (rises are just per diem)
+
+Findings are grouped by axis, trip length and step location. Each group
+records how many grid points hit it, the range of deltas and the worst
+example. They are written to a compact JSON report.
+
+Usage: python3 sweep.py [--max-days N] [--max-miles N] [--max-receipts D]
+                        [--miles-step N] [--receipt-step CENTS] [--threshold D]
+                        [--chunk N] [--workers N] [--output FILE]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from rules import DEFAULT_RULES
+from vectorized import calculate_reimbursement_array
+
+REPORT_PATH = 'sweep_report.json'
+
+
+def add_findings(found, axis, days, positions, deltas, others):
+    """Fold flagged steps into `found`, keyed by (axis, days, position).
+
+    Each value is [count, min delta, max delta, worst delta, worst other
+    coordinate], where the worst delta is the largest in magnitude.
+    """
+    if not len(positions):
+        return
+    order = np.argsort(positions, kind='stable')
+    positions, deltas, others = positions[order], deltas[order], others[order]
+    starts = np.flatnonzero(np.r_[True, positions[1:] != positions[:-1]])
+    ends = np.r_[starts[1:], len(positions)]
+    for lo, hi in zip(starts.tolist(), ends.tolist()):
+        group = deltas[lo:hi]
+        worst = lo + int(np.argmax(np.abs(group)))
+        merge(found, (axis, days, int(positions[lo])),
+              [hi - lo, float(group.min()), float(group.max()), float(deltas[worst]), others[worst].tolist()])
+
+
+def merge(found, key, entry):
+    if key not in found:
+        found[key] = entry
+        return
+    old = found[key]
+    old[0] += entry[0]
+    old[1] = min(old[1], entry[1])
+    old[2] = max(old[2], entry[2])
+    if abs(entry[3]) > abs(old[3]):
+        old[3], old[4] = entry[3], entry[4]
+
+
+def sweep_block(task):
+    """Scan miles rows [lo, hi) across every trip length; returns findings."""
+    lo, hi, grid, threshold, rules = task
+    miles_step, receipt_cents, max_days = grid['miles_step'], grid['receipt_cents'], grid['max_days']
+    receipts = (np.arange(grid['receipt_count']) * receipt_cents / 100)[None, :]
+    # One extra row below the block so the miles step into it is checked here
+    first = max(lo - 1, 0)
+    miles = (np.arange(first, hi, dtype=np.float64) * miles_step)[:, None]
+    own = slice(lo - first, None)
+
+    found = {}
+    previous = None
+    for days in range(1, max_days + 1):
+        values = calculate_reimbursement_array(np.float64(days), miles, receipts, rules)
+
+        step = np.diff(values[own], axis=1)
+        rows, cols = np.nonzero(np.abs(step) > threshold)
+        add_findings(found, 'receipts', days, cols, step[rows, cols], np.column_stack([miles[own][rows, 0]]))
+
+        if len(miles) > 1:
+            step = np.diff(values, axis=0)
+            rows, cols = np.nonzero(np.abs(step) > threshold)
+            add_findings(found, 'miles', days, rows + first, step[rows, cols],
+                         np.column_stack([receipts[0, cols]]))
+
+        if previous is not None:
+            step = values[own] - previous
+            rows, cols = np.nonzero(step < -threshold)
+            add_findings(found, 'days', days, np.zeros(len(rows), dtype=np.int64), step[rows, cols],
+                         np.column_stack([miles[own][rows, 0], receipts[0, cols]]))
+        previous = values[own]
+    return found
+
+
+def describe(key, entry, grid):
+    axis, days, position = key
+    count, low, high, worst, other = entry
+    finding = {'axis': axis, 'days': days}
+    if axis == 'receipts':
+        cents = grid['receipt_cents']
+        finding['from'] = position * cents / 100
+        finding['to'] = (position + 1) * cents / 100
+        finding['worst_at'] = {'miles': other[0]}
+    elif axis == 'miles':
+        finding['from'] = position * grid['miles_step']
+        finding['to'] = (position + 1) * grid['miles_step']
+        finding['worst_at'] = {'receipts': other[0]}
+    else:
+        finding['from'] = days - 1
+        finding['to'] = days
+        finding['worst_at'] = {'miles': other[0], 'receipts': other[1]}
+    finding['kind'] = 'non-monotonic' if low < 0 else 'jump'
+    finding.update(points=count, min_delta=round(low, 4), max_delta=round(high, 4), worst_delta=round(worst, 4))
+    return finding
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--max-days', type=int, default=30)
+    parser.add_argument('--max-miles', type=int, default=2000)
+    parser.add_argument('--max-receipts', type=float, default=3000.0, help="dollars")
+    parser.add_argument('--miles-step', type=int, default=1)
+    parser.add_argument('--receipt-step', type=int, default=1, help="cents")
+    parser.add_argument('--threshold', type=float, default=5.0,
+                        help="dollars; must exceed the model's ordinary change over one grid step")
+    parser.add_argument('--chunk', type=int, default=4_000_000, help="grid points per vectorized call")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--output', default=REPORT_PATH)
+    args = parser.parse_args(argv)
+
+    grid = {
+        'max_days': args.max_days,
+        'miles_step': args.miles_step,
+        'miles_count': args.max_miles // args.miles_step + 1,
+        'receipt_cents': args.receipt_step,
+        'receipt_count': int(round(args.max_receipts * 100)) // args.receipt_step + 1,
+    }
+    rows = max(1, args.chunk // grid['receipt_count'])
+    tasks = [(lo, min(lo + rows, grid['miles_count']), grid, args.threshold, DEFAULT_RULES)
+             for lo in range(0, grid['miles_count'], rows)]
+    total = grid['max_days'] * grid['miles_count'] * grid['receipt_count']
+    print(f"Sweeping {total:,} trips in {len(tasks)} blocks of {rows} miles rows...", file=sys.stderr)
+
+    found = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        for done, block in enumerate(pool.map(sweep_block, tasks), start=1):
+            for key, entry in block.items():
+                merge(found, key, entry)
+            print(f"\r  {done}/{len(tasks)} blocks", end='', file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    print(file=sys.stderr)
+
+    findings = [describe(key, found[key], grid) for key in sorted(found)]
+    report = {
+        'grid': {'days': [1, args.max_days], 'miles': [0, args.max_miles, args.miles_step],
+                 'receipts': [0, args.max_receipts, args.receipt_step / 100]},
+        'threshold': args.threshold,
+        'trips': total,
+        'findings': findings,
+    }
+    with open(args.output, 'w') as f:
+        f.write('{\n' + ',\n'.join(f'"{k}": {json.dumps(v)}' for k, v in report.items() if k != 'findings'))
+        f.write(',\n"findings": [\n' + ',\n'.join(json.dumps(item) for item in findings) + '\n]}\n')
+
+    print(f"🔍 {total:,} trips in {elapsed:.1f}s ({total / elapsed / 1e6:.1f}M/s): "
+          f"{len(findings)} findings written to {args.output}")
+    for axis in ('receipts', 'miles', 'days'):
+        hits = [item for item in findings if item['axis'] == axis]
+        if not hits:
+            continue
+        cliffs = sorted({item['from'] for item in hits})
+        drops = sum(item['kind'] == 'non-monotonic' for item in hits)
+        shown = ', '.join(f"{c:g}" for c in cliffs[:12]) + (' ...' if len(cliffs) > 12 else '')
+        print(f"  {axis:<9}{len(hits):>5} findings ({drops} non-monotonic) at {shown}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
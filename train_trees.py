@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""Train gradient-boosted regression trees and compile them to tree_model.py.
+
+Fits squared-error gradient boosting on public_cases.json over (days, miles,
+receipts, miles per day, receipts per day) with NumPy, then writes the
+ensemble as flat tuples (feature, threshold, left, right, value) into a
+generated module whose predict() walks them with a plain loop. The generated
+module imports nothing, so run.sh pays only for loading its cached bytecode.
+
+Enable it in rules.json with a correction entry such as
+    {"stage": "trees", "blend": 0.5}
+where `blend` is the weight of the tree prediction against the formula.
+
+Usage: python3 train_trees.py [--trees N] [--depth N] [--learning-rate F]
+                              [--min-leaf N] [--holdout F] [--output FILE]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+
+import numpy as np
+
+from case_store import open_store
+
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tree_model.py')
+
+FEATURES = ('days', 'miles', 'receipts', 'miles_per_day', 'receipts_per_day')
+
+
+def feature_matrix(days, miles, receipts):
+    days = np.asarray(days, dtype=np.float64)
+    miles = np.asarray(miles, dtype=np.float64)
+    receipts = np.asarray(receipts, dtype=np.float64)
+    safe_days = np.where(days > 0, days, 1.0)
+    return np.column_stack([days, miles, receipts, miles / safe_days, receipts / safe_days])
+
+
+class Tree:
+    """Regression tree as flat node arrays; feature -1 marks a leaf."""
+
+    def __init__(self):
+        self.feature = []
+        self.threshold = []
+        self.left = []
+        self.right = []
+        self.value = []
+
+    def add_node(self):
+        for column in (self.feature, self.threshold, self.left, self.right, self.value):
+            column.append(0)
+        return len(self.feature) - 1
+
+    def predict(self, X):
+        node = np.zeros(len(X), dtype=np.int64)
+        feature = np.array(self.feature)
+        threshold = np.array(self.threshold, dtype=np.float64)
+        left = np.array(self.left)
+        right = np.array(self.right)
+        active = feature[node] >= 0
+        while active.any():
+            f = feature[node]
+            go_left = X[np.arange(len(X)), np.maximum(f, 0)] <= threshold[node]
+            node = np.where(active, np.where(go_left, left[node], right[node]), node)
+            active = feature[node] >= 0
+        return np.array(self.value, dtype=np.float64)[node]
+
+
+def best_split(X, target, min_leaf):
+    """Best (gain, feature, threshold) over all features, or None."""
+    n = len(target)
+    total = target.sum()
+    best = None
+    for f in range(X.shape[1]):
+        order = np.argsort(X[:, f], kind='stable')
+        values = X[order, f]
+        sums = np.cumsum(target[order])[:-1]
+        counts = np.arange(1, n)
+        # Only split between distinct values, leaving min_leaf on each side
+        ok = (values[1:] != values[:-1]) & (counts >= min_leaf) & (n - counts >= min_leaf)
+        if not ok.any():
+            continue
+        gain = sums ** 2 / counts + (total - sums) ** 2 / (n - counts) - total ** 2 / n
+        gain = np.where(ok, gain, -np.inf)
+        i = int(np.argmax(gain))
+        if best is None or gain[i] > best[0]:
+            best = (gain[i], f, (values[i] + values[i + 1]) / 2)
+    return best
+
+
+def fit_tree(X, target, depth, min_leaf, learning_rate):
+    tree = Tree()
+
+    def grow(rows, level):
+        node = tree.add_node()
+        split = best_split(X[rows], target[rows], min_leaf) if level < depth else None
+        if split is None or split[0] <= 0:
+            tree.feature[node] = -1
+            tree.value[node] = float(target[rows].mean() * learning_rate)
+            return node
+        _, f, threshold = split
+        mask = X[rows, f] <= threshold
+        tree.feature[node] = f
+        tree.threshold[node] = float(threshold)
+        tree.left[node] = grow(rows[mask], level + 1)
+        tree.right[node] = grow(rows[~mask], level + 1)
+        return node
+
+    grow(np.arange(len(target)), 0)
+    return tree
+
+
+def fit_ensemble(X, y, trees=200, depth=4, min_leaf=5, learning_rate=0.1):
+    """Gradient boosting with squared loss; returns (base, [Tree])."""
+    base = float(y.mean())
+    prediction = np.full(len(y), base)
+    ensemble = []
+    for _ in range(trees):
+        tree = fit_tree(X, y - prediction, depth, min_leaf, learning_rate)
+        prediction += tree.predict(X)
+        ensemble.append(tree)
+    return base, ensemble
+
+
+def predict_ensemble(base, ensemble, X):
+    return base + sum(tree.predict(X) for tree in ensemble)
+
+
+def flatten(ensemble):
+    """Concatenate trees into shared node arrays; returns (roots, arrays)."""
+    roots = []
+    arrays = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': []}
+    for tree in ensemble:
+        offset = len(arrays['feature'])
+        roots.append(offset)
+        arrays['feature'] += tree.feature
+        arrays['threshold'] += [float(t) for t in tree.threshold]
+        arrays['left'] += [c + offset if f >= 0 else -1 for c, f in zip(tree.left, tree.feature)]
+        arrays['right'] += [c + offset if f >= 0 else -1 for c, f in zip(tree.right, tree.feature)]
+        arrays['value'] += [float(v) for v in tree.value]
+    return roots, arrays
+
+
+MODULE_TEMPLATE = '''"""Gradient-boosted tree ensemble generated by train_trees.py; do not edit.
+
+{description}
+"""
+
+BASE = {base!r}
+ROOTS = {roots}
+FEATURE = {feature}
+THRESHOLD = {threshold}
+LEFT = {left}
+RIGHT = {right}
+VALUE = {value}
+
+
+def predict(days, miles, receipts):
+    if days > 0:
+        x = (days, miles, receipts, miles / days, receipts / days)
+    else:
+        x = (days, miles, receipts, miles, receipts)
+    total = BASE
+    for node in ROOTS:
+        while FEATURE[node] >= 0:
+            if x[FEATURE[node]] <= THRESHOLD[node]:
+                node = LEFT[node]
+            else:
+                node = RIGHT[node]
+        total += VALUE[node]
+    return total
+
+
+def make_stage(config, rules=None):
+    """Correction stage for reimbursement.load_model: blend with the formula.
+
+    The trees predict amounts directly, so `rules` is not consulted.
+    """
+    blend = config.get('blend', 1.0)
+
+    def stage(days, miles, receipts, amount):
+        return (1.0 - blend) * amount + blend * predict(days, miles, receipts)
+    return stage
+'''
+
+
+def write_module(path, base, ensemble, description):
+    roots, arrays = flatten(ensemble)
+
+    def literal(values):
+        return '(' + ', '.join(repr(v) for v in values) + ',)'
+
+    source = MODULE_TEMPLATE.format(
+        description=description,
+        base=base,
+        roots=literal(roots),
+        **{name: literal(values) for name, values in arrays.items()},
+    )
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(source)
+    os.replace(tmp_path, path)
+
+
+def mean_error(predicted, expected):
+    return float(np.abs(np.round(predicted, 2) - expected).mean())
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', default='public_cases.json')
+    parser.add_argument('--trees', type=int, default=200)
+    parser.add_argument('--depth', type=int, default=4)
+    parser.add_argument('--learning-rate', type=float, default=0.1)
+    parser.add_argument('--min-leaf', type=int, default=5)
+    parser.add_argument('--holdout', type=float, default=0.2,
+                        help="fraction held out to report generalization before the final fit")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=MODEL_PATH)
+    args = parser.parse_args(argv)
+
+    columns = open_store(args.cases)
+    X = feature_matrix(columns.days, columns.miles, columns.receipts)
+    y = np.asarray(columns.expected, dtype=np.float64)
+    params = dict(trees=args.trees, depth=args.depth, min_leaf=args.min_leaf,
+                  learning_rate=args.learning_rate)
+
+    if args.holdout > 0:
+        rng = np.random.default_rng(args.seed)
+        held = rng.random(len(y)) < args.holdout
+        base, ensemble = fit_ensemble(X[~held], y[~held], **params)
+        print(f"Holdout ({held.sum()} cases) average error: "
+              f"${mean_error(predict_ensemble(base, ensemble, X[held]), y[held]):.2f}")
+
+    base, ensemble = fit_ensemble(X, y, **params)
+    print(f"Training ({len(y)} cases) average error: "
+          f"${mean_error(predict_ensemble(base, ensemble, X), y):.2f}")
+
+    description = (f"{args.trees} trees, depth {args.depth}, learning rate {args.learning_rate}, "
+                   f"min leaf {args.min_leaf}; trained on {args.cases}.")
+    write_module(args.output, base, ensemble, description)
+
+    # The generated array walk must reproduce the NumPy ensemble
+    spec = importlib.util.spec_from_file_location('generated_tree_model', args.output)
+    generated = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(generated)
+    compiled = np.array([generated.predict(*row) for row in X[:, :3].tolist()])
+    drift = float(np.abs(compiled - predict_ensemble(base, ensemble, X)).max())
+    if drift > 1e-6:
+        sys.exit(f"Generated module disagrees with the trained ensemble (max drift {drift})")
+    nodes = sum(len(tree.feature) for tree in ensemble)
+    print(f"Wrote {args.output}: {len(ensemble)} trees, {nodes} nodes")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""NumPy version of calculate_reimbursement over whole arrays of trips.
+
+Each component is evaluated piecewise over the band breakpoints in
+rules.json (np.searchsorted picks the band, np.select the efficiency branch in
+if/elif order). Operands are combined in the same order as the scalar model
+so the float results are bit-identical to reimbursement.py.
+
+Usage: python3 vectorized.py [cases.json]   (checks against the scalar path)
+"""
+import sys
+
+import numpy as np
+
+from cases import load_cases
+from rules import DEFAULT_RULES, tier_offsets
+
+
+def base_array(days, rules=DEFAULT_RULES):
+    # Base per diem with penalties for very long trips
+    per_diem = rules['per_diem']
+    rates = np.asarray(per_diem['rates'], dtype=np.float64)
+    base_amount = days * rates[np.searchsorted(per_diem['breaks'], days, side='left')]
+
+    bonus = rules['five_day_bonus']
+    return np.where(days == bonus['days'], base_amount * bonus['factor'], base_amount)
+
+
+def mileage_array(miles, rules=DEFAULT_RULES):
+    # Tiered mileage; each tier adds the full amount of the tiers below it
+    mileage = rules['mileage']
+    lower, offsets = tier_offsets(mileage['breaks'], mileage['rates'])
+    tier = np.searchsorted(mileage['breaks'], miles, side='left')
+    rates = np.asarray(mileage['rates'], dtype=np.float64)
+    return np.asarray(offsets)[tier] + (miles - np.asarray(lower, dtype=np.float64)[tier]) * rates[tier]
+
+
+def receipts_array(receipts, rules=DEFAULT_RULES):
+    # Receipt bands use strict upper bounds
+    bands = rules['receipts']
+    rates = np.asarray(bands['rates'], dtype=np.float64)
+    return receipts * rates[np.searchsorted(bands['breaks'], receipts, side='right')]
+
+
+def efficiency_array(days, miles, receipts, rules=DEFAULT_RULES):
+    # Efficiency multiplier; trips with days <= 0 keep 1.0
+    efficiency = rules['efficiency']
+    positive = days > 0
+    miles_per_day = miles / np.where(positive, days, 1.0)
+
+    one_day = efficiency['one_day']
+    one_day_boost = 1.0 + (miles - one_day['min_miles']) * one_day['slope']
+    one_day_boost = np.where(receipts > one_day['receipt_threshold'],
+                             one_day_boost * one_day['receipt_boost'], one_day_boost)
+
+    conditions = [positive & (days == 1) & (miles > one_day['min_miles'])]
+    choices = [one_day_boost]
+    for band in efficiency['bands']:
+        condition = positive & (miles_per_day > band['min_miles_per_day'])
+        if band['min_receipts'] is not None:
+            condition = condition & (receipts > band['min_receipts'])
+        conditions.append(condition)
+        choices.append(1.0 + (miles_per_day - band['min_miles_per_day']) * band['slope'])
+
+    return np.select(conditions, choices, default=1.0)
+
+
+def calculate_reimbursement_array(days, miles, receipts, rules=DEFAULT_RULES):
+    days = np.asarray(days, dtype=np.float64)
+    miles = np.asarray(miles, dtype=np.float64)
+    receipts = np.asarray(receipts, dtype=np.float64)
+
+    total = base_array(days, rules) + mileage_array(miles, rules) + receipts_array(receipts, rules)
+    return total * efficiency_array(days, miles, receipts, rules)
+
+
+def format_results(results):
+    return [f"{r:.2f}" for r in results.tolist()]
+
+
+def main(argv):
+    from reimbursement import calculate_reimbursement
+
+    path = argv[0] if argv else 'private_cases.json'
+    cases = load_cases(path)
+    days = np.array([c.days for c in cases])
+    miles = np.array([c.miles for c in cases])
+    receipts = np.array([c.receipts for c in cases])
+
+    vectorized = format_results(calculate_reimbursement_array(days, miles, receipts))
+    mismatches = 0
+    for i, c in enumerate(cases):
+        scalar = f"{calculate_reimbursement(c.days, c.miles, c.receipts):.2f}"
+        if scalar != vectorized[i]:
+            mismatches += 1
+            print(f"Case {i + 1}: scalar {scalar} != vectorized {vectorized[i]}")
+    print(f"{len(cases)} cases checked, {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Re-score the public cases every time the model changes.
+
+Loads public_cases.json once, then polls the model sources and data files
+(reimbursement.py, rules.py, rules.json, the correction stage modules and
+their saved indexes, plus any --watch paths) for changes. On each save it
+re-imports the model from source, never from a .pyc whose timestamp check
+can miss a quick edit, re-scores in process with evaluate.evaluate and
+prints what moved since the previous run: score, average error, exact and
+close counts, and the cases that entered or left the ±$0.01 and ±$1.00
+buckets.
+A model that fails to import or raises is reported and the previous one is
+kept, so a half-finished edit does not end the session.
+
+run.sh only imports reimbursement.py, so editing the model there is covered.
+
+Usage: python3 watch.py [cases.json] [--watch PATH ...] [--interval S] [--show N] [--once]
+"""
+import argparse
+import importlib
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import time
+import traceback
+
+from cases import load_cases
+from evaluate import CLOSE_THRESHOLD, EXACT_THRESHOLD, evaluate
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Modules re-imported from source on change: the model and every correction
+# stage module (reimbursement.CORRECTION_STAGES). The list is fixed because
+# after a failed import there is no reimbursement module to ask.
+MODEL_MODULES = ['rules', 'reimbursement', 'knn_correction', 'tree_model', 'cluster_router']
+WATCHED_FILES = ['reimbursement.py', 'rules.py', 'rules.json', 'knn_correction.py', 'knn_index.json',
+                 'tree_model.py', 'cluster_router.py', 'clusters.json']
+
+# Wait this long after the last change so multi-step editor saves settle
+SETTLE_SECONDS = 0.05
+
+
+class SourceLoader(importlib.machinery.SourceFileLoader):
+    """Compiles the source on every import and never reads or writes a .pyc.
+
+    A .pyc is trusted when the source's size and mtime in whole seconds match,
+    so a same-size edit saved within a second of the last import would
+    otherwise re-run the old code.
+    """
+
+    def get_code(self, fullname):
+        return self.source_to_code(self.get_data(self.path), self.path)
+
+
+class SourceFinder:
+    """Meta path finder sending MODEL_MODULES in this directory to SourceLoader."""
+
+    @staticmethod
+    def find_spec(name, path=None, target=None):
+        location = os.path.join(HERE, name + '.py')
+        if name not in MODEL_MODULES or not os.path.exists(location):
+            return None
+        return importlib.util.spec_from_file_location(name, location, loader=SourceLoader(name, location))
+
+
+def load_model():
+    """Import the model afresh and return reimbursement.load_model()."""
+    for name in MODEL_MODULES:
+        sys.modules.pop(name, None)
+    return importlib.import_module('reimbursement').load_model()
+
+
+def snapshot(paths):
+    """(mtime_ns, size) per existing path."""
+    state = {}
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        state[path] = (st.st_mtime_ns, st.st_size)
+    return state
+
+
+def wait_for_change(paths, previous, interval):
+    """Block until a watched file changes; returns (new snapshot, changed paths)."""
+    while True:
+        time.sleep(interval)
+        current = snapshot(paths)
+        if current != previous:
+            time.sleep(SETTLE_SECONDS)
+            current = snapshot(paths)
+            changed = sorted(p for p in set(current) | set(previous) if current.get(p) != previous.get(p))
+            return current, changed
+
+
+def score(cases, model):
+    """evaluate() plus per-case error keyed by case number."""
+    metrics = evaluate(cases, model)
+    metrics['by_case'] = {result[0]: result for result in metrics['results']}
+    return metrics
+
+
+def bucket(metrics, threshold):
+    return {i for i, r in metrics['by_case'].items() if r[3] < threshold}
+
+
+def change(label, old, new, fmt="{}"):
+    if old == new:
+        return f"{label} {fmt.format(new)}"
+    return f"{label} {fmt.format(old)} → {fmt.format(new)}"
+
+
+def print_diff(previous, current, show):
+    print("  " + ", ".join([
+        change("score", previous.get('score'), current.get('score')),
+        change("avg error", previous.get('avg_error'), current.get('avg_error'), "${}"),
+        change("exact", previous['exact_matches'], current['exact_matches']),
+        change("close", previous['close_matches'], current['close_matches']),
+    ]))
+    for name, threshold in (("±$0.01", EXACT_THRESHOLD), ("±$1.00", CLOSE_THRESHOLD)):
+        before = bucket(previous, threshold)
+        after = bucket(current, threshold)
+        for sign, moved in (('+', sorted(after - before)), ('-', sorted(before - after))):
+            if not moved:
+                continue
+            print(f"  {sign}{len(moved)} {'into' if sign == '+' else 'out of'} {name}:")
+            for i in moved[:show]:
+                _, expected, output, error, days, miles, receipts = current['by_case'][i]
+                print(f"      case {i}: {days}d {miles}mi ${receipts} expected {expected:.2f} got {output} "
+                      f"(error ${error:.2f})")
+            if len(moved) > show:
+                print(f"      ... and {len(moved) - show} more")
+    if current['errors']:
+        print(f"  ⚠️  {len(current['errors'])} cases failed, e.g. {current['errors'][0]}")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('cases', nargs='?', default=os.path.join(HERE, 'public_cases.json'))
+    parser.add_argument('--watch', action='append', default=[], help="extra file to watch")
+    parser.add_argument('--interval', type=float, default=0.1, help="polling interval in seconds")
+    parser.add_argument('--show', type=int, default=5, help="moved cases listed per bucket")
+    parser.add_argument('--once', action='store_true', help="score once and exit")
+    args = parser.parse_args(argv)
+
+    sys.path.insert(0, HERE)
+    sys.meta_path.insert(0, SourceFinder)
+    cases = load_cases(args.cases)
+    paths = [os.path.join(HERE, name) for name in WATCHED_FILES] + args.watch
+
+    start = time.perf_counter()
+    current = score(cases, load_model())
+    print(f"👀 {len(cases)} cases loaded; score {current.get('score')}, exact {current['exact_matches']}, "
+          f"close {current['close_matches']} ({(time.perf_counter() - start) * 1000:.0f} ms)")
+    if args.once:
+        return
+
+    state = snapshot(paths)
+    print(f"   watching {', '.join(os.path.relpath(p, HERE) for p in state)}")
+    try:
+        while True:
+            state, changed = wait_for_change(paths, state, args.interval)
+            start = time.perf_counter()
+            stamp = time.strftime('%H:%M:%S')
+            names = ', '.join(os.path.relpath(p, HERE) for p in changed)
+            try:
+                result = score(cases, load_model())
+            except Exception:
+                print(f"[{stamp}] {names} changed; model failed to load, keeping the previous one:")
+                print("  " + traceback.format_exc(limit=-2).rstrip().replace("\n", "\n  "))
+                continue
+            elapsed = (time.perf_counter() - start) * 1000
+            delta = ''
+            if 'score' in result and 'score' in current:
+                delta = f" ({result['score'] - current['score']:+})"
+            print(f"[{stamp}] {names} changed; re-scored in {elapsed:.0f} ms{delta}")
+            print_diff(current, result, args.show)
+            current = result
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])